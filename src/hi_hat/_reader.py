@@ -6,10 +6,6 @@ implement multiple readers or even other plugin contributions. see:
 https://napari.org/stable/plugins/building_a_plugin/guides.html#readers
 """
 
-import nrrd
-import numpy as np
-import tifffile
-
 
 def napari_get_reader(path):
     """A basic implementation of a Reader contribution.
@@ -51,11 +47,17 @@ def reader_function(path):
             viewer.add_* method in napari, and layer_type is a lower-case
             string naming the type of layer.
     """
+    # the readers are imported on first use, as this module is loaded with
+    # the plugin whether or not a file is ever opened
+    import nrrd
+    import tifffile
+
     # Read the file
     if path.endswith(".nrrd"):
         data, header = nrrd.read(path)
-        data = np.array(data)
-        data = np.transpose(data, (2, 1, 0))
+        # pynrrd returns a Fortran-ordered array, so reversing the axes is a
+        # C-contiguous view; copying it first doubled the peak memory
+        data = data.transpose(2, 1, 0)
     else:  # .tiff or .tif
         data = tifffile.imread(path)
 
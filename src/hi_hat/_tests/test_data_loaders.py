@@ -0,0 +1,301 @@
+import pickle
+
+import navis
+import nrrd
+import numpy as np
+import pandas as pd
+import pytest
+
+from hi_hat.utils.data_loaders import (
+    FAFB_loader,
+    _cache_path,
+    _inflate_nrrd,
+    _memmap_nrrd,
+)
+
+HEMILINEAGES = ["HL0", "HL1"]
+NRRD_SUFFIXES = [
+    "_registered_meshes.nrrd",
+    "_CBF_registered_meshes.nrrd",
+    "_hat_bundles.nrrd",
+]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Writes a small dataset with random binary NRRD volumes.
+
+    Args:
+        tmp_path (Path): A pytest fixture for a temporary directory.
+
+    Returns:
+        Path: The root directory of the dataset.
+    """
+    rng = np.random.default_rng(0)
+    pd.DataFrame(
+        {
+            "ito_lee_hemilineage": HEMILINEAGES,
+            "centroid_x": 0.0,
+            "centroid_y": 0.0,
+            "centroid_z": 0.0,
+            "3*RMSE": 1.0,
+        }
+    ).to_csv(tmp_path / "hemilineage_summary.csv", index=False)
+    for hemilineage in HEMILINEAGES:
+        (tmp_path / hemilineage).mkdir()
+        # the voxels are set within a box, so the bounding box is a crop
+        volume = np.zeros((20, 15, 10), dtype=np.uint8)
+        volume[3:17, 2:11, 4:9] = rng.random((14, 9, 5)) > 0.7
+        for suffix in NRRD_SUFFIXES:
+            nrrd.write(
+                str(tmp_path / hemilineage / f"{hemilineage}{suffix}"), volume
+            )
+    return tmp_path
+
+
+def _read_reference(root, hemilineage, suffix):
+    """Reads a volume with pynrrd in the (x, y, z) order of the loader.
+
+    Args:
+        root (Path): The root directory of the dataset.
+        hemilineage (str): The identifier for the hemilineage.
+        suffix (str): The file suffix of the volume.
+
+    Returns:
+        np.ndarray: The voxel data.
+    """
+    return _reference(root / hemilineage / f"{hemilineage}{suffix}")
+
+
+def test_packed_copy_round_trip(dataset):
+    """Tests that `.packed.npz` copies give the voxels of the NRRD files."""
+    FAFB_loader(dataset, hemilineage_number=2).convert_nrrd_cache(
+        packed_only=True
+    )
+    loader = FAFB_loader(dataset, hemilineage_number=2)
+    for hemilineage in HEMILINEAGES:
+        for suffix in NRRD_SUFFIXES:
+            file_path = dataset / hemilineage / f"{hemilineage}{suffix}"
+            assert _cache_path(file_path, ".packed.npz").exists()
+            assert not _cache_path(file_path, ".npy").exists()
+            np.testing.assert_array_equal(
+                loader._get_data(hemilineage, suffix, "nrrd"),
+                _read_reference(dataset, hemilineage, suffix),
+            )
+
+        reference = _read_reference(dataset, hemilineage, "_hat_bundles.nrrd")
+        nonzero = np.nonzero(reference)
+        assert loader.get_hat_bundles_bbox(hemilineage) == tuple(
+            slice(int(axis.min()), int(axis.max()) + 1) for axis in nonzero
+        )
+        assert loader.get_hat_bundles_voxel_count(hemilineage) == int(
+            np.count_nonzero(reference)
+        )
+        assert loader.get_hat_bundles_shape(hemilineage) == reference.shape
+
+
+def test_packed_copy_without_shape_falls_back(dataset):
+    """Tests that packed copies predating the stored shape are ignored."""
+    file_path = dataset / "HL0" / "HL0_hat_bundles.nrrd"
+    # an up-to-date copy without a shape, whose voxels would all be empty
+    np.savez(
+        _cache_path(file_path, ".packed.npz"),
+        packed=np.zeros(1, dtype=np.uint8),
+        bbox=np.zeros((3, 2), dtype=np.int64),
+        voxel_count=0,
+    )
+    loader = FAFB_loader(dataset, hemilineage_number=2)
+    reference = _read_reference(dataset, "HL0", "_hat_bundles.nrrd")
+    np.testing.assert_array_equal(
+        loader.get_hat_bundles_nrrd("HL0"), reference
+    )
+    assert loader.get_hat_bundles_voxel_count("HL0") == int(
+        np.count_nonzero(reference)
+    )
+
+
+def _write_dotprops(root, dotprops):
+    """Pickles the same dotprops as the hat bundles of every hemilineage.
+
+    Args:
+        root (Path): The root directory of the dataset.
+        dotprops (navis.Dotprops): The dotprops to pickle.
+    """
+    for hemilineage in HEMILINEAGES:
+        for suffix in ["_hat_bundles.pkl", "_hat_bundles_sym.pkl"]:
+            path = root / hemilineage / f"{hemilineage}{suffix}"
+            path.write_bytes(pickle.dumps(dotprops))
+
+
+def test_dotprops_copy_round_trip(dataset):
+    """Tests that `.npz` dotprops copies rebuild the pickled dotprops."""
+    rng = np.random.default_rng(4)
+    dotprops = navis.make_dotprops(rng.uniform(0, 50, (300, 3)), k=20)
+    dotprops.units = "1 micron"
+    _write_dotprops(dataset, dotprops)
+    pickled = FAFB_loader(dataset, hemilineage_number=2)
+    FAFB_loader(dataset, hemilineage_number=2).convert_dotprops_cache()
+    loader = FAFB_loader(dataset, hemilineage_number=2)
+
+    file_path = dataset / "HL0" / "HL0_hat_bundles.pkl"
+    assert _cache_path(file_path, ".npz").exists()
+    rebuilt = loader.get_hat_bundles_dps("HL0")
+    np.testing.assert_array_equal(rebuilt.points, dotprops.points)
+    np.testing.assert_array_equal(rebuilt.vect, dotprops.vect)
+    np.testing.assert_array_equal(rebuilt.alpha, dotprops.alpha)
+    assert rebuilt.k == dotprops.k
+    assert rebuilt.units == dotprops.units
+
+    query = navis.make_dotprops(rng.uniform(0, 50, (200, 3)), k=20)
+    query.units = "1 micron"
+
+    def score(loader):
+        targets = navis.NeuronList(
+            [loader.get_hat_bundles_nblast_dps("HL0", k=20)]
+        )
+        return navis.nblast(targets, query, n_cores=1, progress=False)
+
+    np.testing.assert_array_equal(score(loader), score(pickled))
+
+
+def test_dotprops_without_k_stay_pickled(dataset):
+    """Tests that dotprops built without k are skipped with a warning."""
+    rng = np.random.default_rng(5)
+    points = rng.uniform(0, 50, (100, 3))
+    dotprops = navis.Dotprops(points, k=None, vect=np.ones_like(points))
+    _write_dotprops(dataset, dotprops)
+    with pytest.warns(UserWarning, match="k nearest neighbours"):
+        FAFB_loader(dataset, hemilineage_number=2).convert_dotprops_cache()
+    for hemilineage in HEMILINEAGES:
+        file_path = dataset / hemilineage / f"{hemilineage}_hat_bundles.pkl"
+        assert not _cache_path(file_path, ".npz").exists()
+    loaded = FAFB_loader(dataset, hemilineage_number=2).get_hat_bundles_dps(
+        "HL0"
+    )
+    np.testing.assert_array_equal(loaded.points, points)
+    assert loaded.k is None
+
+
+def test_skeleton_copy_round_trip(dataset):
+    """Tests that `.skeleton.npz` copies rebuild the plotted skeletons."""
+    rng = np.random.default_rng(6)
+    dotprops = navis.make_dotprops(rng.uniform(0, 50, (300, 3)), k=5)
+    dotprops.units = "1 micron"
+    _write_dotprops(dataset, dotprops)
+    built = FAFB_loader(dataset, hemilineage_number=2)
+    FAFB_loader(dataset, hemilineage_number=2).convert_dotprops_cache()
+    loader = FAFB_loader(dataset, hemilineage_number=2)
+
+    columns = ["node_id", "parent_id", "x", "y", "z", "radius"]
+    for symmetry in [False, True]:
+        suffix = "_hat_bundles_sym.pkl" if symmetry else "_hat_bundles.pkl"
+        file_path = dataset / "HL0" / f"HL0{suffix}"
+        assert _cache_path(file_path, ".skeleton.npz").exists()
+        expected = built.get_plot_skeleton("HL0", symmetry)
+        loaded = loader.get_plot_skeleton("HL0", symmetry)
+        pd.testing.assert_frame_equal(
+            loaded.nodes[columns].reset_index(drop=True),
+            expected.nodes[columns].reset_index(drop=True),
+            check_dtype=False,
+        )
+        # roots keep the -1 parent navis expects
+        np.testing.assert_array_equal(loaded.root, expected.root)
+        roots = loaded.nodes["node_id"].isin(loaded.root)
+        assert (loaded.nodes.loc[roots, "parent_id"] == -1).all()
+        assert loaded.units == expected.units
+
+
+def _volume():
+    """Makes a small `uint8` volume whose values identify each voxel.
+
+    Returns:
+        np.ndarray: A volume with distinct sizes per axis.
+    """
+    return (np.arange(5 * 6 * 7) % 251).astype(np.uint8).reshape(5, 6, 7)
+
+
+def _reference(path):
+    """Reads a volume with pynrrd in the (x, y, z) order of the loader.
+
+    Args:
+        path (Path): The path to the NRRD file.
+
+    Returns:
+        np.ndarray: The voxel data.
+    """
+    data, _ = nrrd.read(str(path))
+    return np.transpose(data, (2, 1, 0))
+
+
+def test_memmap_nrrd_matches_pynrrd(tmp_path):
+    """Tests that raw `uint8` NRRDs are mapped with the right layout."""
+    path = tmp_path / "raw.nrrd"
+    nrrd.write(str(path), _volume(), {"encoding": "raw"})
+    data = _memmap_nrrd(path)
+    assert data is not None
+    np.testing.assert_array_equal(data, _reference(path))
+
+
+@pytest.mark.parametrize(
+    ("file_name", "header", "detached"),
+    [
+        ("gzip.nrrd", {"encoding": "gzip"}, False),
+        ("skip.nrrd", {"encoding": "raw", "byte skip": 0}, False),
+        ("detached.nhdr", {"encoding": "raw"}, True),
+    ],
+)
+def test_memmap_nrrd_rejects_other_layouts(
+    tmp_path, file_name, header, detached
+):
+    """Tests that compressed or relocated NRRD data is not mapped."""
+    path = tmp_path / file_name
+    nrrd.write(str(path), _volume(), header, detached_header=detached)
+    assert _memmap_nrrd(path) is None
+
+
+def test_memmap_nrrd_rejects_other_types(tmp_path):
+    """Tests that only `uint8` NRRDs are mapped."""
+    path = tmp_path / "uint16.nrrd"
+    nrrd.write(str(path), _volume().astype(np.uint16), {"encoding": "raw"})
+    assert _memmap_nrrd(path) is None
+
+
+def test_inflate_nrrd_matches_pynrrd(tmp_path):
+    """Tests that gzip `uint8` NRRDs are inflated with the right layout."""
+    path = tmp_path / "gzip.nrrd"
+    nrrd.write(str(path), _volume(), {"encoding": "gzip"})
+    data = _inflate_nrrd(path)
+    assert data is not None
+    np.testing.assert_array_equal(data, _reference(path))
+
+
+@pytest.mark.parametrize(
+    ("file_name", "header", "detached"),
+    [
+        ("raw.nrrd", {"encoding": "raw"}, False),
+        ("skip.nrrd", {"encoding": "gzip", "byte skip": 0}, False),
+        ("detached.nhdr", {"encoding": "gzip"}, True),
+    ],
+)
+def test_inflate_nrrd_rejects_other_layouts(
+    tmp_path, file_name, header, detached
+):
+    """Tests that uncompressed or relocated NRRD data is not inflated."""
+    path = tmp_path / file_name
+    nrrd.write(str(path), _volume(), header, detached_header=detached)
+    assert _inflate_nrrd(path) is None
+
+
+def test_inflate_nrrd_rejects_other_types(tmp_path):
+    """Tests that only `uint8` NRRDs are inflated."""
+    path = tmp_path / "uint16.nrrd"
+    nrrd.write(str(path), _volume().astype(np.uint16), {"encoding": "gzip"})
+    assert _inflate_nrrd(path) is None
+
+
+def test_inflate_nrrd_rejects_truncated_data(tmp_path):
+    """Tests that data that is not one complete gzip stream is rejected."""
+    path = tmp_path / "truncated.nrrd"
+    nrrd.write(str(path), _volume(), {"encoding": "gzip"})
+    path.write_bytes(path.read_bytes()[:-8])
+    assert _inflate_nrrd(path) is None
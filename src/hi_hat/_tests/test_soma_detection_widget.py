@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from hi_hat.widgets.soma_detection_widget import _parse_point_indices
+
+
+@pytest.mark.parametrize(
+    ("indices_str", "expected"),
+    [
+        ("1,2,3", [0, 1, 2]),
+        ("1-5", [0, 1, 2, 3, 4]),
+        (" 2 , 4-6 ", [1, 3, 4, 5]),
+        ("", []),
+    ],
+)
+def test_parse_point_indices(indices_str, expected):
+    """Tests that one-based selections become zero-based indices."""
+    indices = _parse_point_indices(indices_str)
+    assert indices.dtype == np.int64
+    np.testing.assert_array_equal(indices, expected)
+
+
+@pytest.mark.parametrize("indices_str", ["5-3", "a"])
+def test_parse_point_indices_rejects_invalid_input(indices_str):
+    """Tests that reversed ranges and non-integers raise."""
+    with pytest.raises(ValueError):
+        _parse_point_indices(indices_str)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from hi_hat.widgets.threshold_widget import _comparison_threshold
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16])
+@pytest.mark.parametrize("threshold", [2.5, -0.5, 255.0, 1e9, np.nan])
+def test_comparison_threshold_matches_float_comparison(dtype, threshold):
+    """Tests that comparing to the converted threshold equals `x > t`."""
+    info = np.iinfo(dtype)
+    values = np.arange(-300, 300)
+    # every value around the thresholds, plus both ends of the dtype
+    values = np.concatenate([values, [info.min, info.max]])
+    image = np.clip(values, info.min, info.max).astype(dtype)
+    np.testing.assert_array_equal(
+        np.greater(image, _comparison_threshold(image.dtype, threshold)),
+        image > threshold,
+    )
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from hi_hat.core import voxel_counting
+from hi_hat.core.query import QueryBundle
+from hi_hat.core.voxel_counting import (
+    bounding_box,
+    count_voxels,
+    count_voxels_in_hemilineage,
+    count_voxels_prepared,
+    pack_voxels,
+    popcount,
+)
+
+SHAPE = (23, 17, 11)
+
+
+class _VolumeLoader:
+    """A stand-in for `FAFB_loader` serving packed in-memory volumes."""
+
+    def __init__(self, volumes):
+        """Keeps the volumes, which are packed when requested.
+
+        Args:
+            volumes (dict[str, np.ndarray]): The volume of each target.
+        """
+        self.volumes = volumes
+
+    def get_hat_bundles_packed(self, name):
+        """The packed bounding box of a target."""
+        volume = self.volumes[name]
+        return pack_voxels(volume[bounding_box(volume)])
+
+    def get_hat_bundles_shape(self, name):
+        """The full shape of a target."""
+        return self.volumes[name].shape
+
+    def get_hat_bundles_bbox(self, name):
+        """The bounding box of a target."""
+        return bounding_box(self.volumes[name])
+
+    def get_hat_bundles_voxel_count(self, name):
+        """The number of voxels of a target."""
+        return int(np.count_nonzero(self.volumes[name]))
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def kernel(request, monkeypatch):
+    """Runs a test with both the NumPy and the Numba overlap kernel.
+
+    Args:
+        request (FixtureRequest): The pytest request of the parameter.
+        monkeypatch (MonkeyPatch): A pytest fixture to patch attributes.
+    """
+    if request.param == "numpy":
+        monkeypatch.setattr(voxel_counting, "njit", None)
+    elif voxel_counting.njit is None:
+        pytest.skip("numba is not installed")
+    return request.param
+
+
+def _reference_score(query, target):
+    """Computes the normalized overlap with plain boolean NumPy math.
+
+    Args:
+        query (np.ndarray): The query volume.
+        target (np.ndarray): The target volume.
+
+    Returns:
+        float: The overlap divided by the number of target voxels.
+    """
+    target_voxels = np.count_nonzero(target)
+    if target_voxels == 0:
+        return 0.0
+    return np.logical_and(query, target).sum() / target_voxels
+
+
+def _random_volume(rng, box=None, dtype=np.uint8):
+    """Makes a random binary volume, set only within a box if given.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        box (tuple[slice, ...], optional): The region to fill.
+        dtype (np.dtype): The dtype of the volume.
+
+    Returns:
+        np.ndarray: The volume.
+    """
+    volume = np.zeros(SHAPE, dtype=dtype)
+    box = box or tuple(slice(None) for _ in SHAPE)
+    region = volume[box]
+    region[...] = rng.random(region.shape) > 0.6
+    return volume
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, bool, np.float32])
+def test_count_voxels_matches_boolean_math(kernel, dtype):
+    """Tests the packed overlap against `np.logical_and` for any dtype."""
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        query = _random_volume(rng, dtype=dtype)
+        target = _random_volume(rng, dtype=dtype)
+        assert count_voxels(query, target) == pytest.approx(
+            _reference_score(query, target)
+        )
+        target_packed = pack_voxels(target)
+        assert count_voxels_prepared(
+            pack_voxels(query), target_packed, popcount(target_packed)
+        ) == pytest.approx(_reference_score(query, target))
+
+
+def test_count_voxels_rejects_shape_mismatch():
+    """Tests that volumes of different shapes are not compared."""
+    with pytest.raises(ValueError):
+        count_voxels(np.ones((4, 4, 4)), np.ones((4, 4, 5)))
+
+
+def test_count_voxels_in_hemilineage_matches_boolean_math(kernel):
+    """Tests cropped overlap counting against the full-volume math."""
+    rng = np.random.default_rng(2)
+    query = _random_volume(rng, (slice(2, 15), slice(0, 12), slice(3, 11)))
+    targets = {
+        "full": _random_volume(rng),
+        "overlapping": _random_volume(
+            rng, (slice(10, 23), slice(5, 17), slice(0, 6))
+        ),
+        # the bounding box misses the query box on the last axis
+        "disjoint": _random_volume(
+            rng, (slice(0, 23), slice(0, 17), slice(0, 3))
+        ),
+        "empty": np.zeros(SHAPE, dtype=np.uint8),
+    }
+    scores = count_voxels_in_hemilineage(
+        QueryBundle(query), list(targets), _VolumeLoader(targets)
+    )
+    assert scores.keys() == targets.keys()
+    for name, target in targets.items():
+        assert scores[name] == pytest.approx(_reference_score(query, target))
+    assert scores["disjoint"] == 0.0
+    assert scores["empty"] == 0.0
+
+
+def test_count_voxels_in_hemilineage_rejects_shape_mismatch(kernel):
+    """Tests that the full shapes are compared, not the cropped sizes."""
+    rng = np.random.default_rng(3)
+    target = _random_volume(rng)
+    query = np.ones(tuple(size + 5 for size in SHAPE), dtype=bool)
+    with pytest.raises(ValueError):
+        count_voxels_in_hemilineage(
+            QueryBundle(query), ["target"], _VolumeLoader({"target": target})
+        )
@@ -1,16 +1,32 @@
 import numpy as np
 
 
-def _JRC2018U_mirror(pt):
-    """Mirrors a 3D point across the JRC2018U template's midline.
+def _JRC2018U_mirror_inplace(pts, axis=0):
+    """Mirrors 3D points across the JRC2018U template's midline in place.
 
     Args:
-        pt (np.ndarray): A 3D point coordinate (x, y, z).
+        pts (np.ndarray): A float array of 3D coordinates with shape (3,) or
+            (N, 3). It is modified in place.
+        axis (int): The position of the x coordinate in each point. Defaults
+            to 0 for (x, y, z) points; use -1 for (z, y, x) viewer points.
+    """
+    pts[..., axis] = 627 - pts[..., axis]
+
+
+def _JRC2018U_mirror(pt, axis=0):
+    """Mirrors 3D points across the JRC2018U template's midline.
+
+    Args:
+        pt (np.ndarray): A 3D point coordinate, or an (N, 3) array of them.
+        axis (int): The position of the x coordinate in each point. Defaults
+            to 0 for (x, y, z) points; use -1 for (z, y, x) viewer points.
 
     Returns:
-        np.ndarray: The mirrored 3D point coordinate.
+        np.ndarray: The mirrored 3D point coordinate(s).
     """
-    return np.array([627 - pt[0], pt[1], pt[2]])
+    mirrored = np.array(pt, dtype=float)
+    _JRC2018U_mirror_inplace(mirrored, axis)
+    return mirrored
 
 
 def centroid_matching(user_centroid, loader):
@@ -56,24 +72,26 @@ def centroid_matching(user_centroid, loader):
         raise ValueError(f"CSV must contain columns: {required_cols}")
     print("successfully validated columns")
 
-    # Compute distances from user_centroid to each hemilineage centroid
-    hemilineage_coords = df[["centroid_x", "centroid_y", "centroid_z"]].values
-    user_coords = np.array(user_centroid)
-    distances = np.linalg.norm(hemilineage_coords - user_coords, axis=1)
-    # compare mirrored distances just incase user click on the left side
-    mirrored_user_coords = _JRC2018U_mirror(user_coords)
-    mirrored_distances = np.linalg.norm(
-        hemilineage_coords - mirrored_user_coords, axis=1
-    )
-    df["distance"] = np.minimum(distances, mirrored_distances)
+    # Compute squared distances from the user centroid and its mirror (in
+    # case the user clicked on the left side) in a single broadcast. Only
+    # the comparison against 3*RMSE matters, so the sqrt is skipped.
+    hemilineage_coords = df[
+        ["centroid_x", "centroid_y", "centroid_z"]
+    ].to_numpy(dtype=float)
+    query_coords = np.tile(np.asarray(user_centroid, dtype=float), (2, 1))
+    _JRC2018U_mirror_inplace(query_coords[1])
+    diff = hemilineage_coords[:, None, :] - query_coords[None, :, :]
+    sq_distances = np.einsum("nij,nij->ni", diff, diff).min(axis=1)
     # print min and max of distance
-    print(f"Min distance: {df['distance'].min()}")
-    print(f"Max distance: {df['distance'].max()}")
-
-    matches = df[df["distance"] <= df["3*RMSE"]].copy()
-    matches = matches.sort_values("distance")
+    print(f"Min distance: {np.sqrt(sq_distances.min())}")
+    print(f"Max distance: {np.sqrt(sq_distances.max())}")
 
-    hemilineage_names = matches["ito_lee_hemilineage"].tolist()
+    # filter and sort in NumPy; only the matched names are materialized
+    thresholds = df["3*RMSE"].to_numpy(dtype=float, copy=False)
+    names = df["ito_lee_hemilineage"].to_numpy(copy=False)
+    match_idx = np.flatnonzero(sq_distances <= thresholds * thresholds)
+    match_idx = match_idx[np.argsort(sq_distances[match_idx], kind="stable")]
+    hemilineage_names = names[match_idx].tolist()
     return {
         "user_centroid": tuple(float(c) for c in user_centroid),
         "hemilineages": hemilineage_names,
@@ -1,54 +1,71 @@
+import os
+from functools import partial
+
 import navis
 
+from ..utils.prefetch import prefetch
+from .query import QueryBundle
+
 
 def hat_nblast(
-    query_path: str,
+    query: QueryBundle,
     target_list: list[str],
-    th: int,
     loader: any,
     progress_wrapper=None,
+    n_cores: int | None = None,
 ) -> dict:
     """Performs NBLAST between a query neuron and a list of target hemilineages.
 
-    This function reads a query neuron from a file, converts it to a 'dotprops'
-    representation, and then computes the NBLAST similarity score against a
-    list of target hemilineage bundles.
+    This function takes the 'dotprops' representation of a query neuron and
+    computes the NBLAST similarity score against a list of target hemilineage
+    bundles. All targets are scored in a single `navis.nblast` call.
 
     Args:
-        query_path (str): The file path to the query neuron image (e.g., NRRD).
+        query (QueryBundle): The binarized query image. Its dotprops are
+            built on first use and reused afterwards.
         target_list (list[str]): A list of names of the target hemilineages
             to compare against.
-        th (int): The threshold value used to binarize the query image when
-            generating dotprops.
         loader (any): An instance of a data loader class that provides access
-            to hemilineage bundle data via a `get_hat_bundles_dps()` method.
+            to hemilineage bundle data via a `get_hat_bundles_nblast_dps()`
+            method.
         progress_wrapper (callable, optional): A wrapper function (like tqdm)
-            to provide progress updates for the iteration over the target list.
+            to provide progress updates while loading the target list.
             Defaults to None.
+        n_cores (int | None): The number of cores NBLAST runs on.
+            Defaults to half the number of CPUs.
 
     Returns:
         dict: A dictionary where keys are the target hemilineage names and
             values are their corresponding NBLAST scores against the query.
             Example: {'hemilineage_A': 0.75, 'hemilineage_B': -0.12}
     """
-    print(f"NBLAST: Making dotprops for {query_path}...")
-    query_dps = navis.read_nrrd(
-        query_path, output="dotprops", threshold=th, k=100, resample=1
-    )
+    query_dps = query.dotprops
     print(f"NBLAST: Loaded {len(query_dps)} points from query.")
-    query_dps = navis.drop_fluff(query_dps)
-    results = {}
-    iterable = target_list
+    # load the next targets in the background while one is being prepared
+    iterable = prefetch(
+        partial(loader.get_hat_bundles_nblast_dps, symmetry=True),
+        target_list,
+    )
     if progress_wrapper:
         iterable = progress_wrapper(
-            target_list,
-            desc="NBLAST",
+            iterable,
+            desc="NBLAST: Loading targets",
+            total=len(target_list),
         )
-    for hat in iterable:
+    targets = {}
+    for hat, hat_bundle in iterable:
         print(f"NBLAST: Processing {hat}...")
-        hat_bundle = loader.get_hat_bundles_dps(hat, symmetry=True)
-        hat_bundle = navis.make_dotprops(hat_bundle, k=100)
         if hat_bundle is not None:
-            score = navis.nblast_smart(hat_bundle, query_dps).values[0][0]
-            results[hat] = score
-    return results
+            targets[hat] = hat_bundle
+    if not targets:
+        return {}
+
+    # score every target against the query in one batch; the targets are
+    # the NBLAST queries so scores stay normalized by the hemilineage bundle
+    scores = navis.nblast(
+        navis.NeuronList(list(targets.values())),
+        query_dps,
+        n_cores=n_cores or max(1, os.cpu_count() // 2),
+        progress=False,
+    )
+    return scores.iloc[:, 0].to_dict()
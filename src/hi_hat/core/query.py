@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from functools import cached_property
+
+import navis
+import numpy as np
+
+from .voxel_counting import bounding_box
+
+
+@dataclass
+class QueryBundle:
+    """A binarized query image with the representations used for matching.
+
+    The voxels are used directly for voxel counting. The NBLAST dotprops are
+    built on first access and then reused, so they are only computed once
+    per match. If the raw image and its threshold are given, the dotprops
+    are built from them the way `navis.read_nrrd` thresholds an image, so
+    NBLAST scores match those computed from the query file; otherwise the
+    voxels are used.
+
+    Attributes:
+        voxels (np.ndarray): The binarized query image, in the axis order
+            used by the viewer.
+        voxel_size (float | tuple[float, ...]): The voxel size in microns,
+            one value or one per axis in the axis order used by the viewer.
+            Defaults to 0.38, the resolution of the JRC2018U template.
+        image (np.ndarray | None): The raw query image the voxels were
+            binarized from. Defaults to None.
+        threshold (float | None): The threshold of the binarized image.
+            Defaults to None.
+    """
+
+    voxels: np.ndarray
+    voxel_size: float | tuple[float, ...] = 0.38
+    image: np.ndarray | None = None
+    threshold: float | None = None
+
+    @cached_property
+    def bbox(self) -> tuple[slice, ...]:
+        """tuple[slice, ...]: The bounding box of the query voxels."""
+        return bounding_box(self.voxels)
+
+    @cached_property
+    def dotprops(self) -> navis.Dotprops:
+        """navis.Dotprops: The query dotprops for NBLAST, in microns."""
+        mask = self.voxels
+        if self.image is not None:
+            mask = _nblast_mask(self.image, self.threshold)
+        # transpose the viewer axis order back to the (x, y, z) order of the
+        # NRRD files, which also keeps navis' point order for ties in the
+        # nearest-neighbor tangents
+        spacing = np.broadcast_to(
+            np.asarray(self.voxel_size, dtype=np.float64), (mask.ndim,)
+        )[::-1]
+        points = np.multiply(np.argwhere(mask.T), spacing, dtype=np.float64)
+        dps = navis.make_dotprops(points, k=100, resample=1)
+        dps.units = "1 micron"
+        return navis.drop_fluff(dps)
+
+
+def _nblast_mask(image: np.ndarray, threshold: float | None) -> np.ndarray:
+    """Thresholds a query image the way `navis.read_nrrd` does for dotprops.
+
+    Args:
+        image (np.ndarray): The query image.
+        threshold (float | None): Values of at least `threshold` are
+            foreground if it is 1 or more, values of at least that fraction
+            of the image maximum if it is between 0 and 1. If it is 0 or
+            None, every non-zero value is foreground.
+
+    Returns:
+        np.ndarray: A boolean mask of the foreground.
+
+    Raises:
+        ValueError: If the threshold is negative.
+    """
+    if not threshold:
+        return image != 0
+    if threshold >= 1:
+        return image >= threshold
+    if threshold > 0:
+        return image >= threshold * image.max()
+    raise ValueError(f"Threshold must be either >=1 or 0-1, got {threshold}")
+
+
+def make_query_bundle(
+    image: np.ndarray,
+    threshold: float,
+    voxel_size: float | tuple[float, ...] = 0.38,
+) -> QueryBundle:
+    """Binarizes a query image and wraps it in a `QueryBundle`.
+
+    Args:
+        image (np.ndarray): The query image, in the axis order used by the
+            viewer.
+        threshold (float): Voxels above this value are foreground.
+        voxel_size (float | tuple[float, ...]): The voxel size in microns.
+            Defaults to 0.38.
+
+    Returns:
+        QueryBundle: The bundle for the binarized image, which also keeps
+            the image for NBLAST.
+    """
+    return QueryBundle(image > threshold, voxel_size, image, threshold)
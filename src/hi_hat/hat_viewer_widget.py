@@ -1,7 +1,11 @@
+from functools import partial
 from typing import TYPE_CHECKING
 
+import pandas as pd
+from napari.qt.threading import thread_worker
 from napari.utils import progress
 from napari.utils.notifications import show_error, show_info, show_warning
+from qtpy.QtCore import QTimer
 from qtpy.QtWidgets import (
     QCheckBox,
     QComboBox,
@@ -10,14 +14,14 @@ from qtpy.QtWidgets import (
     QLabel,
     QLineEdit,
     QListWidget,
-    QListWidgetItem,
     QPushButton,
     QVBoxLayout,
     QWidget,
 )
 
-from .utils.colors import generate_random_hex_color
-from .utils.plotter import plot_tracts
+from .utils.colors import distinct_hex_colors
+from .utils.layers import find_layer, layers_in_viewer
+from .utils.prefetch import prefetch
 from .widgets import ConnectionWidget, ResultsLoaderWidget
 
 if TYPE_CHECKING:
@@ -36,7 +40,8 @@ class HatViewer(QWidget):
         viewer (napari.viewer.Viewer): The napari viewer instance.
         loader (FAFB_loader): An instance of the data loader.
         results_df (pd.DataFrame): A DataFrame holding the matching results.
-        added_layers (list): A list of napari layers added by this widget.
+        added_layers (dict[str, napari.layers.Layer]): The napari layers
+            added by this widget, keyed by layer name.
     """
 
     def __init__(self, viewer: "napari.viewer.Viewer"):
@@ -49,7 +54,14 @@ class HatViewer(QWidget):
         self.viewer = viewer
         self.loader = None
         self.results_df = None
-        self.added_layers = []
+        self.added_layers = {}
+        # background workers of _on_add_layers that are still loading
+        self._load_workers = []
+        self._n_colors_used = 0
+        # searchable hemilineage lists (see `_searchable`) of the dataset
+        # and of each status filter, rebuilt on connection and results load
+        self._all_hemilineages = _searchable([])
+        self._hemilineages_by_status = {}
 
         # --- UI Setup ---
         self.setLayout(QVBoxLayout())
@@ -116,7 +128,12 @@ class HatViewer(QWidget):
         add_btn.clicked.connect(self._on_add_layers)
         clean_btn.clicked.connect(self._on_clean_all)
         plot_btn.clicked.connect(self._on_plot_tracts)
-        self.search_box.textChanged.connect(self._update_hemilineage_list)
+        # collapse fast typing into one list update
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._update_hemilineage_list)
+        self.search_box.textChanged.connect(self._search_timer.start)
 
         # --- Initial Load ---
         self.results_loader_widget.perform_initial_load()
@@ -130,9 +147,20 @@ class HatViewer(QWidget):
         """
         self.results_df = df
         print(self.results_df)
+        self._hemilineages_by_status = {}
         # First, set the state of the filter controls
         if self.results_df is not None and not self.results_df.empty:
             print("Results DataFrame loaded successfully.")
+            hemilineages = self.results_df.groupby("status", sort=False)[
+                "Hemilineage"
+            ]
+            self._hemilineages_by_status = {
+                status: _searchable(names.unique())
+                for status, names in hemilineages
+            }
+            self._hemilineages_by_status["All"] = _searchable(
+                self.results_df["Hemilineage"].unique()
+            )
             self.status_filter_combo.setEnabled(True)
             self.filter_btn.setEnabled(True)
         else:
@@ -150,44 +178,50 @@ class HatViewer(QWidget):
                 connection was successful, otherwise None.
         """
         self.loader = loader_instance
+        self._all_hemilineages = _searchable(
+            self.loader.get_hemilineage_list() if self.loader else []
+        )
         if self.loader:
             self._update_hemilineage_list()
 
     def _update_hemilineage_list(self):
         """Updates the list of hemilineages based on search and filter criteria."""
+        # this update already uses the current search text
+        self._search_timer.stop()
         self.hemilineage_list_widget.clear()
         if not self.loader:
             return
 
         # Determine the base list of hemilineages
-        base_hemilineages = []
         filter_active = self.filter_btn.isEnabled()
 
         if filter_active and self.results_df is not None:
             selected_status = self.status_filter_combo.currentText()
-            if selected_status == "All":
-                base_hemilineages = (
-                    self.results_df["Hemilineage"].unique().tolist()
-                )
-            else:
-                base_hemilineages = (
-                    self.results_df[
-                        self.results_df["status"] == selected_status
-                    ]["Hemilineage"]
-                    .unique()
-                    .tolist()
-                )
+            names = self._hemilineages_by_status.get(
+                selected_status, self._all_hemilineages.iloc[:0]
+            )
         else:
-            base_hemilineages = self.loader.get_hemilineage_list()
+            names = self._all_hemilineages
 
-        # Filter by search text
+        # Filter by search text; names are sorted, so the names starting
+        # with it are one slice, and other substring matches are only
+        # searched for if there are none
         search_text = self.search_box.text().lower()
-        filtered_list = [
-            name for name in base_hemilineages if search_text in name.lower()
-        ]
+        if search_text:
+            start, stop = names.searchsorted(
+                [search_text, search_text + "\uffff"]
+            )
+            if start < stop:
+                names = names.iloc[start:stop]
+            else:
+                names = names[
+                    names.str.contains(search_text, regex=False, na=False)
+                ]
 
-        for name in filtered_list:
-            self.hemilineage_list_widget.addItem(QListWidgetItem(name))
+        # one layout pass for the whole list instead of one per item
+        self.hemilineage_list_widget.setUpdatesEnabled(False)
+        self.hemilineage_list_widget.addItems(names.index.tolist())
+        self.hemilineage_list_widget.setUpdatesEnabled(True)
 
     def _on_add_layers(self):
         """Adds selected hemilineages as new layers to the viewer."""
@@ -200,42 +234,107 @@ class HatViewer(QWidget):
             show_warning("No hemilineages selected.")
             return
 
-        hemilineage_names = [item.text() for item in selected_items]
         data_type = self.data_type_combo.currentText()
+        # layers already in the viewer are neither read nor uploaded again
+        hemilineage_names = [
+            item.text()
+            for item in selected_items
+            if find_layer(self.viewer, f"{item.text()}_{data_type}") is None
+        ]
+        if not hemilineage_names:
+            show_info("The selected layers have already been added.")
+            return
+        colors = dict(
+            zip(
+                hemilineage_names,
+                distinct_hex_colors(
+                    len(hemilineage_names), self._n_colors_used
+                ),
+                strict=True,
+            )
+        )
+        self._n_colors_used += len(hemilineage_names)
+        if data_type == "Whole neuron":
+            load = self.loader.get_whole_neuron_nrrd
+        elif data_type == "CBF":
+            load = self.loader.get_cellbody_fiber_nrrd
+        else:  # Bundles
+            load = self.loader.get_hat_bundles_nrrd
+
+        # volumes are read on worker threads and added here as they arrive,
+        # so the viewer stays responsive while the files load
+        worker = _load_volumes(load, hemilineage_names)
+        worker.yielded.connect(
+            partial(self._on_volume_loaded, worker, data_type, colors)
+        )
+        worker.finished.connect(partial(self._on_worker_finished, worker))
+        self._load_workers.append(worker)
+        worker.start()
+
+    def _on_volume_loaded(self, worker, data_type, colors, result):
+        """Adds a volume loaded by `_load_volumes` as a new layer.
+
+        Args:
+            worker (GeneratorWorker): The worker that loaded the volume.
+            data_type (str): The data type selected when loading started.
+            colors (dict[str, str]): The layer color of each hemilineage.
+            result (tuple[str, Any]): The hemilineage name and its volume, or
+                the exception raised while loading it.
+        """
+        if worker not in self._load_workers:
+            return  # cleaned up while loading
+        hemilineage_name, data = result
+        if isinstance(data, Exception):
+            show_error(f"Failed to load {hemilineage_name}: {data}")
+            return
+        layer_name = f"{hemilineage_name}_{data_type}"
+        if find_layer(self.viewer, layer_name) is not None:
+            return  # added by an earlier click while this one was loading
+        layer_kwargs = {
+            "name": layer_name,
+            "axis_labels": ("x", "y", "z"),
+            "blending": "additive",
+            "contrast_limits": [0, 1],
+            "colormap": colors[hemilineage_name],
+            "scale": (0.38, 0.38, 0.38),
+            "units": ("micron", "micron", "micron"),
+            "metadata": {"hemilineage": hemilineage_name},
+        }
+        new_layer = self.viewer.add_image(data, **layer_kwargs)
+        self.added_layers[new_layer.name] = new_layer
+
+    def _on_worker_finished(self, worker):
+        """Forgets a finished volume loading worker.
 
-        for hemilineage_name in hemilineage_names:
-            try:
-                if data_type == "Whole neuron":
-                    data = self.loader.get_whole_neuron_nrrd(hemilineage_name)
-                elif data_type == "CBF":
-                    data = self.loader.get_cellbody_fiber_nrrd(
-                        hemilineage_name
-                    )
-                else:  # Bundles
-                    data = self.loader.get_hat_bundles_nrrd(hemilineage_name)
-                layer_name = f"{hemilineage_name}_{data_type}"
-                layer_kwargs = {
-                    "name": layer_name,
-                    "axis_labels": ("x", "y", "z"),
-                    "blending": "additive",
-                    "contrast_limits": [0, 1],
-                    "colormap": generate_random_hex_color(),
-                    "scale": (0.38, 0.38, 0.38),
-                    "units": ("micron", "micron", "micron"),
-                    "metadata": {"hemilineage": hemilineage_name},
-                }
-                new_layer = self.viewer.add_image(data, **layer_kwargs)
-                self.added_layers.append(new_layer)
-
-            except (FileNotFoundError, ValueError) as e:
-                show_error(f"Failed to load {hemilineage_name}: {e}")
+        Args:
+            worker (GeneratorWorker): The worker that finished.
+        """
+        if worker in self._load_workers:
+            self._load_workers.remove(worker)
 
     def _on_clean_all(self):
         """Removes all layers added by this widget from the viewer."""
-        for layer in self.added_layers:
-            if layer in self.viewer.layers:
+        # stop loads still in flight so they do not add layers afterwards
+        for worker in self._load_workers:
+            worker.quit()
+        self._load_workers.clear()
+        # batch the removals, as LayerList.clear does, so listeners of the
+        # layer list events are notified once rather than per layer
+        with self.viewer.layers.batched_update():
+            for layer in layers_in_viewer(
+                self.viewer, self.added_layers.values()
+            ):
                 self.viewer.layers.remove(layer)
+        if self.loader:
+            # free the volumes now rather than when the LRU cache evicts them
+            self.loader.release_volumes(
+                [
+                    layer.metadata["hemilineage"]
+                    for layer in self.added_layers.values()
+                ]
+            )
         self.added_layers.clear()
+        self._n_colors_used = 0
         show_info("Removed all added layers.")
 
     def _on_plot_tracts(self):
@@ -259,19 +358,75 @@ class HatViewer(QWidget):
         if dialog.exec_():
             save_path = dialog.selectedFiles()[0]
             plot_symmetry = checkbox.isChecked()
-
-            active_hemilineages = {}
-            for layer in self.added_layers:
-                if layer in self.viewer.layers:
-                    active_hemilineages[layer.metadata["hemilineage"]] = (
-                        layer.colormap.name
-                    )
+            # matplotlib and navis are only needed once a plot is requested
+            from .utils.plotter import plot_tracts
 
             plot_tracts(
-                active_hemilineages,
+                self._iter_active_hemilineages(),
                 save_path,
                 self.loader,
                 plot_symmetry,
                 progress,
             )
             show_info(f"Plotting saved to {save_path}")
+
+    def _iter_active_hemilineages(self):
+        """Yields the hemilineages of the added layers still in the viewer.
+
+        Yields:
+            tuple[str, str]: The name and color of each hemilineage, once
+                per hemilineage even if several of its layers were added.
+        """
+        seen = set()
+        for layer in layers_in_viewer(self.viewer, self.added_layers.values()):
+            hemilineage = layer.metadata["hemilineage"]
+            if hemilineage not in seen:
+                seen.add(hemilineage)
+                yield hemilineage, layer.colormap.name
+
+
+def _searchable(hemilineages) -> pd.Series:
+    """Prepares hemilineage names for repeated case-insensitive searches.
+
+    Args:
+        hemilineages (Iterable[str]): The hemilineage names.
+
+    Returns:
+        pd.Series: The lowercased names, indexed by the original names and
+            sorted so prefix matches can be found by binary search.
+    """
+    names = pd.Index(hemilineages, dtype=object)
+    searchable = pd.Series(names.str.lower(), index=names, dtype=object)
+    return searchable.sort_values(kind="stable")
+
+
+def _try_load(load, hemilineage):
+    """Calls a loader getter, returning its error instead of raising it.
+
+    Args:
+        load (callable): A loader getter such as `get_hat_bundles_nrrd`.
+        hemilineage (str): The hemilineage to load.
+
+    Returns:
+        Any: The loaded volume, or the `FileNotFoundError`/`ValueError`
+            raised while loading it.
+    """
+    try:
+        return load(hemilineage)
+    except (FileNotFoundError, ValueError) as e:
+        return e
+
+
+@thread_worker
+def _load_volumes(load, hemilineages):
+    """Loads volumes on worker threads, yielding them in input order.
+
+    Args:
+        load (callable): A loader getter such as `get_hat_bundles_nrrd`.
+        hemilineages (list[str]): The hemilineages to load.
+
+    Yields:
+        tuple[str, Any]: Each hemilineage with its volume, or with the
+            exception raised while loading it.
+    """
+    yield from prefetch(partial(_try_load, load), hemilineages, depth=4)
@@ -75,6 +75,11 @@ class HiMatch(QWidget):
         self.soma_detection_widget.matched.connect(
             self.matching_hat_widget.set_hemilineages
         )
+        # a running match reads the binarized image, which thresholding
+        # overwrites in place
+        self.matching_hat_widget.matching.connect(
+            self.threshold_widget.setDisabled
+        )
         self.results_loader_widget.results_loaded.connect(
             self.soma_detection_widget._on_results_loaded
         )
@@ -1,4 +1,63 @@
-import random
+import numpy as np
+
+# matplotlib's tab20 followed by the first four Set3 colors
+DISTINCT_HEX_COLORS = (
+    "#1f77b4",
+    "#aec7e8",
+    "#ff7f0e",
+    "#ffbb78",
+    "#2ca02c",
+    "#98df8a",
+    "#d62728",
+    "#ff9896",
+    "#9467bd",
+    "#c5b0d5",
+    "#8c564b",
+    "#c49c94",
+    "#e377c2",
+    "#f7b6d2",
+    "#7f7f7f",
+    "#c7c7c7",
+    "#bcbd22",
+    "#dbdb8d",
+    "#17becf",
+    "#9edae5",
+    "#8dd3c7",
+    "#ffffb3",
+    "#bebada",
+    "#fb8072",
+)
+
+
+def distinct_hex_colors(n: int, start: int = 0) -> list[str]:
+    """Takes colors from a fixed qualitative palette.
+
+    Colors past the end of the palette are generated randomly.
+
+    Args:
+        n (int): The number of colors to take.
+        start (int): The palette position of the first color.
+
+    Returns:
+        list[str]: A list of hex color strings, e.g., ['#RRGGBB', ...].
+    """
+    colors = list(DISTINCT_HEX_COLORS[start : start + n])
+    colors.extend(generate_random_hex_colors(n - len(colors)))
+    return colors
+
+
+def generate_random_hex_colors(n: int) -> list[str]:
+    """Generates a batch of random 6-digit hex color codes.
+
+    Args:
+        n (int): The number of colors to generate.
+
+    Returns:
+        list[str]: A list of hex color strings, e.g., ['#RRGGBB', ...].
+    """
+    rng = np.random.default_rng()
+    values = rng.integers(0, 0x1000000, size=n, dtype=np.uint32)
+    return [f"#{v:06x}" for v in values.tolist()]
 
 
 def generate_random_hex_color() -> str:
@@ -7,10 +66,10 @@ def generate_random_hex_color() -> str:
     Returns:
         str: A hex color string, e.g., '#RRGGBB'.
     """
-    return f"#{random.randint(0, 0xFFFFFF):06x}"
+    return generate_random_hex_colors(1)[0]
 
 
 if __name__ == "__main__":
     # Generate and print 5 random hex colors
-    for _ in range(5):
-        print(generate_random_hex_color())
+    for color in generate_random_hex_colors(5):
+        print(color)
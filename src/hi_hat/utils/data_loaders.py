@@ -1,14 +1,49 @@
 # load hemilineage data from a target directory
 
+import os
 import pickle
+import threading
+import warnings
+import zlib
+from collections import OrderedDict
+from functools import partial
 from pathlib import Path
 from typing import Any
 
+import navis
 import nrrd
 import numpy as np
 import numpy.typing as npt
 import pandas as pd
 
+from ..core.voxel_counting import bounding_box, pack_voxels, popcount
+from .prefetch import prefetch
+
+# The summary CSV columns used by the package, with their dtypes
+SUMMARY_COLUMNS = {
+    "ito_lee_hemilineage": str,
+    "centroid_x": float,
+    "centroid_y": float,
+    "centroid_z": float,
+    "3*RMSE": float,
+}
+
+# NRRD type names of unsigned 8-bit data, which can be used without conversion
+_NRRD_UINT8_TYPES = {"uchar", "unsigned char", "uint8", "uint8_t"}
+# Header fields that move the data away from the end of the header
+_NRRD_LAYOUT_FIELDS = (
+    "data file",
+    "datafile",
+    "line skip",
+    "lineskip",
+    "byte skip",
+    "byteskip",
+)
+
+# Bump whenever the layout or dtype of the `.npy`/`.npz` data copies changes,
+# so copies written by an older version are ignored instead of misread.
+CACHE_VERSION = 1
+
 
 class FAFB_loader:
     """Handles loading FAFB hemilineage data from a directory.
@@ -17,24 +52,65 @@ class FAFB_loader:
     to access different data components, such as neuron skeletons, voxel masks,
     and NBLAST dotprops.
 
+    Loaders in separate processes share no cache. Volumes memory-mapped from
+    the `.npy` copies written by `convert_nrrd_cache`, or on first load with
+    `write_volume_copies`, are backed by the OS page cache, so processes
+    reading the same dataset share their pages instead of each holding a
+    decompressed copy.
+
     Attributes:
         fafb_root (Path): The root directory of the FAFB dataset.
         hemilineage_list (list[str]): A list of hemilineage names.
         hemilineage_df (pd.DataFrame): A DataFrame containing summary
             information about the hemilineages.
+        cache_size (int): The maximum number of voxel volumes kept in memory.
+        max_cache_bytes (int | None): The maximum total size of the voxel
+            volumes held in memory, or None for no size limit.
+        write_volume_copies (bool): Whether compressed NRRD volumes are
+            written to memory-mappable `.npy` copies when first loaded.
     """
 
-    def __init__(self, path: str, hemilineage_number: int = 197):
+    def __init__(
+        self,
+        path: str,
+        hemilineage_number: int = 197,
+        cache_size: int = 8,
+        max_cache_bytes: int | None = None,
+        write_volume_copies: bool = False,
+    ):
         """Initializes the loader and validates the data path.
 
         Args:
             path (str): The root path of the FAFB dataset.
             hemilineage_number (int): The expected number of hemilineages.
+            cache_size (int): The maximum number of voxel volumes kept in
+                memory. Pickled objects such as dotprops and packed hat
+                bundles are small and are always cached. Defaults to 8.
+            max_cache_bytes (int | None): The maximum total size of the
+                cached voxel volumes in bytes. Memory-mapped volumes are not
+                counted, as the OS pages them in and out. The most recently
+                used volume is always kept. Defaults to None, no limit.
+            write_volume_copies (bool): If True, a compressed NRRD volume is
+                decompressed once into the `.npy` copy `convert_nrrd_cache`
+                would write, and memory-mapped from there, so it does not
+                stay in RAM. Needs write access to the dataset directory.
+                Defaults to False.
         """
         self.fafb_root = Path(path)
         self.hemilineage_list: list[str] = []
-        self._read_hemilineage_list(hemilineage_number)
+        self._hemilineage_set: frozenset[str] = frozenset()
         self.hemilineage_df: pd.DataFrame = pd.DataFrame()
+        self.cache_size = cache_size
+        self.max_cache_bytes = max_cache_bytes
+        self.write_volume_copies = write_volume_copies
+        # dataset files are static, so loaded data is cached per loader
+        self._volume_cache: OrderedDict[tuple, Any] = OrderedDict()
+        self._object_cache: dict[tuple, Any] = {}
+        self._volume_cache_bytes = 0
+        self._file_paths: dict[tuple[str, str], Path] = {}
+        # data may be prefetched from worker threads
+        self._cache_lock = threading.Lock()
+        self._read_hemilineage_list(hemilineage_number)
 
     def _read_hemilineage_list(self, hemilineage_number: int):
         """Reads the hemilineage list from the summary CSV.
@@ -61,10 +137,12 @@ class FAFB_loader:
                 f"Dataset is not complete, missing {hemilineage_csv}"
             )
 
-        self.hemilineage_df = pd.read_csv(hemilineage_csv)
+        self.hemilineage_df = _read_summary_csv(hemilineage_csv)
         self.hemilineage_list = self.hemilineage_df[
             "ito_lee_hemilineage"
         ].tolist()
+        # for constant-time membership checks on every load
+        self._hemilineage_set = frozenset(self.hemilineage_list)
 
         if len(self.hemilineage_list) != hemilineage_number:
             raise ValueError(
@@ -75,16 +153,20 @@ class FAFB_loader:
     def get_somas(self) -> pd.DataFrame:
         """Gets the somas data for all hemilineages.
 
+        The summary CSV is parsed once in `__init__`; this returns that
+        DataFrame rather than re-reading the file on every call.
+
         Returns:
             pd.DataFrame: A DataFrame containing soma information.
         """
-        hemilineage_csv = self.fafb_root / "hemilineage_summary.csv"
-        self.hemilineage_df = pd.read_csv(hemilineage_csv)
         return self.hemilineage_df
 
     def validate_dataset(self, progress_wrapper=None):
         """Checks if the dataset is complete by verifying required files.
 
+        Only every tenth hemilineage is checked; missing files of the others
+        are reported when they are loaded.
+
         Args:
             progress_wrapper (callable, optional): A function like
                 `napari.utils.progress` to wrap the iterator for progress
@@ -94,7 +176,8 @@ class FAFB_loader:
             bool: True if all required files are found.
 
         Raises:
-            FileNotFoundError: If a required file is missing.
+            FileNotFoundError: If required files are missing, listing all of
+                the missing files that were checked.
         """
         suffixes = [
             "_registered_meshes.nrrd",  # whole neuron voxels
@@ -104,40 +187,190 @@ class FAFB_loader:
         ]
         # To-do: update the naming system of the files
 
-        iterable = self.hemilineage_list[0::10]
+        hemilineages = self.hemilineage_list[0::10]
+        # one directory listing per hemilineage instead of a stat per file,
+        # with several listings in flight, as each is a round trip on
+        # network storage
+        iterable = prefetch(
+            partial(_list_file_names, self.fafb_root), hemilineages, depth=16
+        )
         if progress_wrapper:
             iterable = progress_wrapper(
                 iterable,
                 desc="Validating dataset:",
+                total=len(hemilineages),
+            )
+
+        missing = []
+        for i, present in iterable:
+            missing.extend(
+                str(self.fafb_root / i / f"{i}{suffix}")
+                for suffix in suffixes
+                if f"{i}{suffix}" not in present
+            )
+        if missing:
+            raise FileNotFoundError(
+                f"Dataset is not complete, missing {', '.join(missing)}"
+            )
+
+        print(f"All required files found in {self.fafb_root}.")
+        return True
+
+    def convert_nrrd_cache(self, progress_wrapper=None, packed_only=False):
+        """Writes a memory-mappable `.npy` copy of every NRRD volume.
+
+        The copies are stored next to the NRRD files in the (x, y, z) order
+        used by the viewer, so `_get_data` can memory-map them instead of
+        decompressing the NRRD on every load. The hat bundles additionally
+        get a `.packed.npz` copy holding the bit-packed voxels of their
+        bounding box, which `get_hat_bundles_packed` loads directly. Copies
+        that are newer than their NRRD are skipped.
+
+        Args:
+            progress_wrapper (callable, optional): A function like
+                `napari.utils.progress` to wrap the iterator for progress
+                tracking. Defaults to None.
+            packed_only (bool): If True, every volume gets only a
+                `.packed.npz` copy, which `_get_data` unpacks on load. These
+                are more than eight times smaller than the `.npy` copies but
+                cannot be memory-mapped. Defaults to False.
+        """
+        suffixes = [
+            "_registered_meshes.nrrd",
+            "_CBF_registered_meshes.nrrd",
+            "_hat_bundles.nrrd",
+        ]
+
+        iterable = self.hemilineage_list
+        if progress_wrapper:
+            iterable = progress_wrapper(
+                iterable,
+                desc="Converting NRRD files:",
             )
 
         for i in iterable:
             for suffix in suffixes:
-                file_path = self.fafb_root / i / f"{i}{suffix}"
+                file_path = self._file_path(i, suffix)
                 if not file_path.exists():
-                    raise FileNotFoundError(
-                        f"Dataset is not complete, missing {file_path}"
+                    continue
+                npy_path = _cache_path(file_path, ".npy")
+                data = None
+                if not packed_only and not _is_up_to_date(npy_path, file_path):
+                    data = _read_nrrd(file_path)
+                    _save_npy(npy_path, data)
+                if suffix != "_hat_bundles.nrrd" and not packed_only:
+                    continue
+                packed_path = _cache_path(file_path, ".packed.npz")
+                if _is_up_to_date(packed_path, file_path):
+                    continue
+                if data is None:
+                    data = (
+                        np.load(npy_path, mmap_mode="r")
+                        if _is_up_to_date(npy_path, file_path)
+                        else _read_nrrd(file_path)
                     )
+                tmp_path = packed_path.with_name(f"{packed_path.stem}.tmp.npz")
+                _save_packed(tmp_path, data)
+                tmp_path.replace(packed_path)
 
-        print(f"All required files found in {self.fafb_root}.")
-        return True
+    def convert_dotprops_cache(self, progress_wrapper=None):
+        """Writes an `.npz` copy of every pickled hat bundles dotprops.
+
+        The copies hold only the point, vector and alpha arrays plus `k` and
+        the units, so `_get_data` can rebuild the `Dotprops` without
+        unpickling a Python object graph tied to the navis version. The
+        skeleton `get_plot_skeleton` builds from the dotprops is stored in a
+        `.skeleton.npz` copy as well, so plotting skips the navis processing.
+        Copies that are newer than their pickle are skipped.
+
+        Args:
+            progress_wrapper (callable, optional): A function like
+                `napari.utils.progress` to wrap the iterator for progress
+                tracking. Defaults to None.
+        """
+        # the stale pickles of the next hemilineages are read while the
+        # current ones are skeletonized and written
+        iterable = prefetch(
+            self._read_stale_dotprops, self.hemilineage_list, depth=4
+        )
+        if progress_wrapper:
+            iterable = progress_wrapper(
+                iterable,
+                desc="Converting dotprops:",
+                total=len(self.hemilineage_list),
+            )
+
+        for _, stale in iterable:
+            for file_path, dps in stale:
+                npz_path = _cache_path(file_path, ".npz")
+                skeleton_path = _cache_path(file_path, ".skeleton.npz")
+                if not _is_up_to_date(skeleton_path, file_path):
+                    tmp_path = skeleton_path.with_name(
+                        f"{skeleton_path.stem}.tmp.npz"
+                    )
+                    _save_skeleton(tmp_path, _build_plot_skeleton(dps))
+                    tmp_path.replace(skeleton_path)
+                if not isinstance(dps, navis.Dotprops) or _is_up_to_date(
+                    npz_path, file_path
+                ):
+                    continue
+                if dps.k is None:
+                    # navis cannot compute the alpha values without k, so
+                    # these dotprops stay pickled
+                    warnings.warn(
+                        f"Skipping {file_path.name}: its dotprops were not "
+                        "built from k nearest neighbours.",
+                        stacklevel=2,
+                    )
+                    continue
+                tmp_path = npz_path.with_name(f"{npz_path.stem}.tmp.npz")
+                _save_dotprops(tmp_path, dps)
+                tmp_path.replace(npz_path)
+
+    def _read_stale_dotprops(self, hemilineage: str) -> list[tuple[Path, Any]]:
+        """Unpickles the dotprops of a hemilineage with outdated copies.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+
+        Returns:
+            list[tuple[Path, Any]]: The path and unpickled dotprops of every
+                hat bundles pickle whose `.npz` or `.skeleton.npz` copy is
+                missing or older than the pickle.
+        """
+        stale = []
+        for suffix in ["_hat_bundles.pkl", "_hat_bundles_sym.pkl"]:
+            file_path = self._file_path(hemilineage, suffix)
+            if not file_path.exists() or (
+                _is_up_to_date(_cache_path(file_path, ".npz"), file_path)
+                and _is_up_to_date(
+                    _cache_path(file_path, ".skeleton.npz"), file_path
+                )
+            ):
+                continue
+            stale.append((file_path, _unpickle(file_path)))
+        return stale
 
     def get_JRC2018U_mesh(self) -> Any:
         """Gets the JRC2018U brain mesh for plotting.
 
+        The mesh is cached, so it is only unpickled for the first plot.
+
         Returns:
             Any: The loaded JRC2018U mesh data, typically a pickled object.
 
         Raises:
             FileNotFoundError: If the mesh file is not found.
         """
-        JRC2018U_path = self.fafb_root / "flybrains.JRC2018U.mesh.pkl"
-        if not JRC2018U_path.exists():
-            raise FileNotFoundError(
-                f"Dataset is not complete, missing {JRC2018U_path}"
-            )
-        with open(JRC2018U_path, "rb") as f:
-            return pickle.load(f)
+        key = ("JRC2018U_mesh",)
+        if key not in self._object_cache:
+            JRC2018U_path = self.fafb_root / "flybrains.JRC2018U.mesh.pkl"
+            if not JRC2018U_path.exists():
+                raise FileNotFoundError(
+                    f"Dataset is not complete, missing {JRC2018U_path}"
+                )
+            self._object_cache[key] = _unpickle(JRC2018U_path)
+        return self._object_cache[key]
 
     def get_hemilineage_list(self) -> list[str]:
         """Gets the list of available hemilineages.
@@ -147,13 +380,114 @@ class FAFB_loader:
         """
         return self.hemilineage_list
 
-    def _get_data(self, hemilineage: str, suffix: str, file_type: str) -> Any:
+    def _cache_volume(self, key: tuple, data: npt.NDArray[Any]):
+        """Stores a read-only volume in the bounded LRU cache.
+
+        Args:
+            key (tuple): The cache key.
+            data (npt.NDArray[Any]): The array to cache.
+        """
+        data.flags.writeable = False
+        with self._cache_lock:
+            if key in self._volume_cache:
+                self._forget_volume(key)
+            self._volume_cache[key] = data
+            self._volume_cache_bytes += _resident_nbytes(data)
+            while len(self._volume_cache) > 1 and (
+                len(self._volume_cache) > self.cache_size
+                or self._volume_cache_bytes > (self.max_cache_bytes or np.inf)
+            ):
+                self._forget_volume(next(iter(self._volume_cache)))
+
+    def _forget_volume(self, key: tuple):
+        """Removes a volume from the LRU cache; the lock must be held.
+
+        Args:
+            key (tuple): The cache key.
+        """
+        data = self._volume_cache.pop(key)
+        self._volume_cache_bytes -= _resident_nbytes(data)
+
+    def clear_cache(self):
+        """Drops all data cached in memory by this loader.
+
+        The versioned copies written next to the dataset files by the
+        `convert_*` methods are kept.
+        """
+        with self._cache_lock:
+            self._volume_cache.clear()
+            self._volume_cache_bytes = 0
+            self._object_cache.clear()
+
+    def release_volumes(self, hemilineages: list[str]):
+        """Drops the cached NRRD volumes of some hemilineages.
+
+        Packed hat bundles are not held in the volume cache and are kept,
+        so voxel counting against these hemilineages stays fast.
+
+        Args:
+            hemilineages (list[str]): The hemilineages whose volumes are no
+                longer needed, e.g. because their layers were removed.
+        """
+        hemilineages = set(hemilineages)
+        with self._cache_lock:
+            for key in list(self._volume_cache):
+                if key[0] in hemilineages:
+                    self._forget_volume(key)
+
+    def _get_cached_volume(self, key: tuple) -> npt.NDArray[Any] | None:
+        """Looks up a volume in the LRU cache and marks it as recently used.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            npt.NDArray[Any] | None: The cached array, or None if absent.
+        """
+        with self._cache_lock:
+            if key not in self._volume_cache:
+                return None
+            self._volume_cache.move_to_end(key)
+            return self._volume_cache[key]
+
+    def _file_path(self, hemilineage: str, suffix: str) -> Path:
+        """Gets the path of a hemilineage data file, building it only once.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+            suffix (str): The file suffix to identify the data type.
+
+        Returns:
+            Path: The path of the file, which may not exist.
+        """
+        key = (hemilineage, suffix)
+        file_path = self._file_paths.get(key)
+        if file_path is None:
+            file_path = self.fafb_root / hemilineage / f"{hemilineage}{suffix}"
+            self._file_paths[key] = file_path
+        return file_path
+
+    def _get_data(
+        self, hemilineage: str, suffix: str, file_type: str, cache=True
+    ) -> Any:
         """A private helper to load data files securely.
 
+        Results are cached: NRRD volumes in a bounded LRU cache of
+        `cache_size` entries, pickled objects without a bound. Cached arrays
+        are read-only so callers cannot corrupt them.
+
+        NRRD volumes are always `uint8` masks, but their values depend on
+        where they are read from: `uint8` files keep their stored values
+        (e.g. 255), while other types and `.packed.npz` copies give 0/1. So
+        voxel values are only meaningful as zero or nonzero. Mapped `uint8`
+        data is not normalized, as that would copy the whole volume.
+
         Args:
             hemilineage (str): The identifier for the hemilineage.
             suffix (str): The file suffix to identify the data type.
             file_type (str): The type of file to load ('nrrd' or 'pkl').
+            cache (bool): If False, a NRRD volume that is not cached yet is
+                loaded without being added to the cache. Defaults to True.
 
         Returns:
             Any: The loaded data, either a NumPy array or a pickled object.
@@ -162,22 +496,52 @@ class FAFB_loader:
             ValueError: If the hemilineage is not found or file type is unsupported.
             FileNotFoundError: If the required data file is not found.
         """
-        if hemilineage not in self.hemilineage_list:
+        if hemilineage not in self._hemilineage_set:
             raise ValueError(
                 f"Hemilineage '{hemilineage}' not found in the dataset."
             )
 
-        file_path = self.fafb_root / hemilineage / f"{hemilineage}{suffix}"
+        key = (hemilineage, suffix)
+        if file_type == "nrrd":
+            data = self._get_cached_volume(key)
+            if data is not None:
+                return data
+        if file_type == "pkl" and key in self._object_cache:
+            return self._object_cache[key]
+
+        file_path = self._file_path(hemilineage, suffix)
 
         if not file_path.exists():
             raise FileNotFoundError(f"Required file not found: {file_path}")
 
         if file_type == "nrrd":
-            data, _ = nrrd.read(file_path)
-            return np.transpose(data, (2, 1, 0))
+            npy_path = _cache_path(file_path, ".npy")
+            packed_path = _cache_path(file_path, ".packed.npz")
+            data = None
+            if _is_up_to_date(npy_path, file_path):
+                # written by convert_nrrd_cache(), already in (x, y, z) order
+                data = np.load(npy_path, mmap_mode="r")
+            elif _is_up_to_date(packed_path, file_path):
+                # unpacking bits is much cheaper than inflating a gzip NRRD
+                data = _unpack_volume(packed_path)
+            if data is None:
+                data = _memmap_nrrd(file_path)
+            if data is None:
+                data = _read_nrrd(file_path)
+                if self.write_volume_copies:
+                    data = _write_volume_copy(npy_path, data)
+            if cache:
+                self._cache_volume(key, data)
+            return data
         elif file_type == "pkl":
-            with open(file_path, "rb") as f:
-                return pickle.load(f)
+            npz_path = _cache_path(file_path, ".npz")
+            if _is_up_to_date(npz_path, file_path):
+                # written by convert_dotprops_cache(), avoids unpickling
+                data = _load_dotprops(npz_path)
+            else:
+                data = _unpickle(file_path)
+            self._object_cache[key] = data
+            return data
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
 
@@ -216,11 +580,102 @@ class FAFB_loader:
         """
         return self._get_data(hemilineage, "_hat_bundles.nrrd", "nrrd")
 
+    def get_hat_bundles_packed(self, hemilineage: str) -> npt.NDArray[Any]:
+        """Gets the bit-packed hat bundles voxels for a specific hemilineage.
+
+        Only the bounding box of the bundle (see `get_hat_bundles_bbox`) is
+        packed. The packed array is cached instead of the raw volume, which
+        is eight times larger even before cropping, and is kept outside the
+        bounded volume cache, so matching more targets than `cache_size`
+        does not reload them. If `convert_nrrd_cache` wrote an up-to-date
+        packed copy, it is loaded instead of the volume.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+
+        Returns:
+            npt.NDArray[Any]: A flat `uint8` array, as from `pack_voxels`.
+        """
+        key = ("packed", hemilineage)
+        if key in self._object_cache:
+            return self._object_cache[key]
+        file_path = self._file_path(hemilineage, "_hat_bundles.nrrd")
+        packed_path = _cache_path(file_path, ".packed.npz")
+        loaded = None
+        if (
+            hemilineage in self._hemilineage_set
+            and file_path.exists()
+            and _is_up_to_date(packed_path, file_path)
+        ):
+            loaded = _load_packed(packed_path)
+        if loaded is not None:
+            packed, bbox, voxel_count, shape = loaded
+        else:
+            data = self._get_data(
+                hemilineage, "_hat_bundles.nrrd", "nrrd", cache=False
+            )
+            shape = data.shape
+            bbox = bounding_box(data)
+            packed = pack_voxels(data[bbox])
+            voxel_count = popcount(packed)
+        self._object_cache[("shape", hemilineage)] = shape
+        self._object_cache[("bbox", hemilineage)] = bbox
+        self._object_cache[("voxel_count", hemilineage)] = voxel_count
+        packed.flags.writeable = False
+        self._object_cache[key] = packed
+        return packed
+
+    def get_hat_bundles_shape(self, hemilineage: str) -> tuple[int, ...]:
+        """Gets the shape of the full hat bundles volume.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+
+        Returns:
+            tuple[int, ...]: The (x, y, z) shape of the volume, before it is
+                cropped to its bounding box.
+        """
+        key = ("shape", hemilineage)
+        if key not in self._object_cache:
+            self.get_hat_bundles_packed(hemilineage)
+        return self._object_cache[key]
+
+    def get_hat_bundles_bbox(self, hemilineage: str) -> tuple[slice, ...]:
+        """Gets the bounding box of the hat bundles voxels.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+
+        Returns:
+            tuple[slice, ...]: One slice per axis of the (x, y, z) volume.
+        """
+        key = ("bbox", hemilineage)
+        if key not in self._object_cache:
+            self.get_hat_bundles_packed(hemilineage)
+        return self._object_cache[key]
+
+    def get_hat_bundles_voxel_count(self, hemilineage: str) -> int:
+        """Gets the number of hat bundles voxels for a specific hemilineage.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+
+        Returns:
+            int: The number of non-zero voxels.
+        """
+        key = ("voxel_count", hemilineage)
+        if key not in self._object_cache:
+            self.get_hat_bundles_packed(hemilineage)
+        return self._object_cache[key]
+
     def get_hat_bundles_dps(
         self, hemilineage: str, symmetry: bool = False
     ) -> Any:
         """Gets the hat bundles dotprops for a specific hemilineage.
 
+        The pickles are expected to hold `Dotprops` built with `k=100`, the
+        value NBLAST uses, so `get_hat_bundles_nblast_dps` can use them as-is.
+
         Args:
             hemilineage (str): The identifier for the hemilineage.
             symmetry (bool): If True, loads the symmetrized dotprops.
@@ -234,6 +689,484 @@ class FAFB_loader:
         else:
             return self._get_data(hemilineage, "_hat_bundles_sym.pkl", "pkl")
 
+    def get_hat_bundles_nblast_dps(
+        self, hemilineage: str, symmetry: bool = False, k: int = 100
+    ) -> Any:
+        """Gets the hat bundles dotprops prepared for NBLAST.
+
+        Stored dotprops that were not built with `k` nearest neighbours are
+        recomputed with `navis.make_dotprops`. The id of the returned
+        dotprops is set to the hemilineage name, so several bundles can be
+        batched in one NBLAST. The result is cached, so any recomputation
+        only happens once per hemilineage.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+            symmetry (bool): If True, uses the symmetrized dotprops.
+                Defaults to False.
+            k (int): The number of nearest neighbours used to compute
+                tangent vectors. Defaults to 100.
+
+        Returns:
+            Any: A navis `Dotprops` object ready to be used with NBLAST.
+        """
+        key = ("nblast_dps", hemilineage, symmetry, k)
+        if key not in self._object_cache:
+            hat_bundle = self.get_hat_bundles_dps(hemilineage, symmetry)
+            if (
+                isinstance(hat_bundle, navis.Dotprops)
+                and getattr(hat_bundle, "k", None) == k
+            ):
+                # already built with the right k; copy to keep the id change
+                # out of the raw pickle cache
+                dps = hat_bundle.copy()
+            else:
+                dps = navis.make_dotprops(hat_bundle, k=k)
+            dps.id = hemilineage
+            self._object_cache[key] = dps
+        return self._object_cache[key]
+
+    def get_plot_skeleton(
+        self, hemilineage: str, symmetry: bool = False
+    ) -> Any:
+        """Gets the hat bundles skeleton used for plotting tracts.
+
+        The dotprops are resampled, reduced to their two largest fragments and
+        skeletonized, unless `convert_dotprops_cache` stored the result. The
+        result is cached, so replotting a hemilineage does not repeat this
+        work.
+
+        Args:
+            hemilineage (str): The identifier for the hemilineage.
+            symmetry (bool): If True, uses the symmetrized dotprops.
+                Defaults to False.
+
+        Returns:
+            Any: A navis `TreeNeuron` of the hat bundles.
+        """
+        key = ("plot_skeleton", hemilineage, symmetry)
+        if key not in self._object_cache:
+            suffix = "_hat_bundles_sym.pkl" if symmetry else "_hat_bundles.pkl"
+            file_path = self._file_path(hemilineage, suffix)
+            skeleton_path = _cache_path(file_path, ".skeleton.npz")
+            if file_path.exists() and _is_up_to_date(skeleton_path, file_path):
+                # written by convert_dotprops_cache()
+                skeleton = _load_skeleton(skeleton_path)
+            else:
+                skeleton = _build_plot_skeleton(
+                    self.get_hat_bundles_dps(hemilineage, symmetry)
+                )
+            self._object_cache[key] = skeleton
+        return self._object_cache[key]
+
+
+def _read_summary_csv(file_path: Path) -> pd.DataFrame:
+    """Reads the columns listed in `SUMMARY_COLUMNS` from the summary CSV.
+
+    The summary has one row per hemilineage, so the C engine is used: for a
+    few hundred rows it beats the pyarrow engine, which also costs a pyarrow
+    import on first use. A missing column is skipped here and reported by
+    the code that needs it.
+
+    Args:
+        file_path (Path): The path to the summary CSV.
+
+    Returns:
+        pd.DataFrame: The typed summary columns.
+    """
+    return pd.read_csv(
+        file_path,
+        usecols=lambda column: column in SUMMARY_COLUMNS,
+        dtype=SUMMARY_COLUMNS,
+    )
+
+
+def _list_file_names(root: Path, hemilineage: str) -> set[str]:
+    """Lists the files in the directory of a hemilineage.
+
+    Args:
+        root (Path): The root directory of the dataset.
+        hemilineage (str): The identifier for the hemilineage.
+
+    Returns:
+        set[str]: The file names, empty if the directory does not exist.
+    """
+    try:
+        with os.scandir(root / hemilineage) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+def _read_nrrd(file_path: Path) -> npt.NDArray[np.uint8]:
+    """Reads an NRRD volume and reorders its axes to (x, y, z).
+
+    The dataset volumes are binary masks, so anything that is not already
+    `uint8` is downcast to a 0/1 `uint8` array to keep memory traffic low.
+    `uint8` data keeps its stored values, so only whether a voxel is zero
+    is meaningful.
+
+    Args:
+        file_path (Path): The path to the NRRD file.
+
+    Returns:
+        npt.NDArray[np.uint8]: The voxel data.
+    """
+    data = _inflate_nrrd(file_path)
+    if data is not None:
+        return data
+    data, _ = nrrd.read(file_path)
+    if data.dtype != np.uint8:
+        data = (data != 0).view(np.uint8)
+    # pynrrd returns Fortran-ordered arrays, so the transpose is already a
+    # C-contiguous view and this does not copy; it only guards the packing
+    # and overlap code against strided reads if that ever changes
+    return np.ascontiguousarray(np.transpose(data, (2, 1, 0)))
+
+
+def _memmap_nrrd(file_path: Path) -> npt.NDArray[np.uint8] | None:
+    """Memory-maps the voxels of an uncompressed `uint8` NRRD file.
+
+    Only the pages that are actually read, e.g. the slices shown in the
+    viewer, are loaded from disk.
+
+    Args:
+        file_path (Path): The path to the NRRD file.
+
+    Returns:
+        npt.NDArray[np.uint8] | None: A read-only view of the voxel data in
+            the same axis order as `_read_nrrd`, or None if the file is
+            compressed, stores its data separately or is not `uint8`.
+    """
+    with open(file_path, "rb") as f:
+        header = nrrd.read_header(f)
+        offset = f.tell()
+    if header.get("encoding") != "raw" or not _is_plain_uint8(header):
+        return None
+    data = np.memmap(
+        file_path,
+        dtype=np.uint8,
+        mode="r",
+        offset=offset,
+        shape=tuple(int(size) for size in header["sizes"]),
+        order="F",
+    )
+    # NRRD data is Fortran-ordered, so this is a C-contiguous view
+    return np.transpose(data, (2, 1, 0))
+
+
+def _inflate_nrrd(file_path: Path) -> npt.NDArray[np.uint8] | None:
+    """Decompresses the voxels of a gzip-encoded `uint8` NRRD file.
+
+    Unlike `nrrd.read`, which grows a bytearray chunk by chunk, the data is
+    inflated in one call into a buffer of the known final size.
+
+    Args:
+        file_path (Path): The path to the NRRD file.
+
+    Returns:
+        npt.NDArray[np.uint8] | None: A read-only array of the voxel data in
+            the same axis order as `_read_nrrd`, or None if the file is not
+            gzip-encoded, stores its data separately, is not `uint8`, or is
+            not a single gzip stream.
+    """
+    with open(file_path, "rb") as f:
+        header = nrrd.read_header(f)
+        encoding = header.get("encoding")
+        if encoding not in ("gzip", "gz") or not _is_plain_uint8(header):
+            return None
+        compressed = f.read()
+    shape = tuple(int(size) for size in header["sizes"])
+    n_voxels = int(np.prod(shape))
+    try:
+        buffer = zlib.decompress(
+            compressed, wbits=zlib.MAX_WBITS | 16, bufsize=n_voxels
+        )
+    except zlib.error:
+        return None
+    if len(buffer) != n_voxels:
+        return None
+    data = np.frombuffer(buffer, dtype=np.uint8).reshape(shape, order="F")
+    # NRRD data is Fortran-ordered, so this is a C-contiguous view
+    return np.transpose(data, (2, 1, 0))
+
+
+def _is_plain_uint8(header: dict) -> bool:
+    """Checks that a NRRD header describes attached `uint8` data.
+
+    Args:
+        header (dict): The NRRD header.
+
+    Returns:
+        bool: True if the data is `uint8` and follows the header directly.
+    """
+    return header.get("type") in _NRRD_UINT8_TYPES and not any(
+        field in header for field in _NRRD_LAYOUT_FIELDS
+    )
+
+
+def _resident_nbytes(data: npt.NDArray[Any]) -> int:
+    """Returns the number of bytes an array holds in memory.
+
+    Args:
+        data (npt.NDArray[Any]): The array, possibly a view.
+
+    Returns:
+        int: The size of the array, or 0 if it is backed by a memory map.
+    """
+    base = data
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return 0
+        base = base.base
+    return data.nbytes
+
+
+def _cache_path(file_path: Path, extension: str) -> Path:
+    """Gets the path of the NumPy copy of a dataset file.
+
+    Args:
+        file_path (Path): The path to the NRRD or pickle file.
+        extension (str): The extension of the copy, '.npy', '.packed.npz',
+            '.npz' or '.skeleton.npz'.
+
+    Returns:
+        Path: The versioned path written by `convert_nrrd_cache` or
+            `convert_dotprops_cache`.
+    """
+    return file_path.with_suffix(f".v{CACHE_VERSION}{extension}")
+
+
+def _save_npy(npy_path: Path, data: npt.NDArray[Any]):
+    """Writes the `.npy` copy of a volume.
+
+    The copy is written to a temporary file first, so readers never see a
+    partially written copy.
+
+    Args:
+        npy_path (Path): The path of the `.npy` copy.
+        data (npt.NDArray[Any]): The volume in (x, y, z) order.
+    """
+    tmp_path = npy_path.with_name(f"{npy_path.stem}.tmp.npy")
+    np.save(tmp_path, data)
+    tmp_path.replace(npy_path)
+
+
+def _write_volume_copy(
+    npy_path: Path, data: npt.NDArray[Any]
+) -> npt.NDArray[Any]:
+    """Writes the `.npy` copy of a decompressed volume and maps it back.
+
+    Args:
+        npy_path (Path): The path of the `.npy` copy.
+        data (npt.NDArray[Any]): The volume in (x, y, z) order.
+
+    Returns:
+        npt.NDArray[Any]: A memory map of the copy, or `data` itself if the
+            copy cannot be written, e.g. on a read-only dataset.
+    """
+    try:
+        _save_npy(npy_path, data)
+    except OSError:
+        return data
+    return np.load(npy_path, mmap_mode="r")
+
+
+def _save_packed(file_path: Path, volume: npt.NDArray[Any]):
+    """Writes the bit-packed bounding box of a volume to an `.npz` file.
+
+    Args:
+        file_path (Path): The path of the `.npz` file.
+        volume (npt.NDArray[Any]): The binary volume in (x, y, z) order.
+    """
+    bbox = bounding_box(volume)
+    packed = pack_voxels(volume[bbox])
+    np.savez(
+        file_path,
+        packed=packed,
+        bbox=np.array([(s.start, s.stop) for s in bbox], dtype=np.int64),
+        voxel_count=popcount(packed),
+        shape=np.array(volume.shape, dtype=np.int64),
+    )
+
+
+def _load_packed(
+    file_path: Path,
+) -> (
+    tuple[npt.NDArray[np.uint8], tuple[slice, ...], int, tuple[int, ...]]
+    | None
+):
+    """Reads a file written by `_save_packed`.
+
+    Args:
+        file_path (Path): The path of the `.npz` file.
+
+    Returns:
+        tuple[npt.NDArray[np.uint8], tuple[slice, ...], int, tuple[int, ...]]
+            | None: The packed voxels, their bounding box, the number of set
+            voxels and the shape of the full volume, or None if the file
+            predates storing the volume shape.
+    """
+    with np.load(file_path) as z:
+        if "shape" not in z:
+            return None
+        bbox = tuple(slice(int(a), int(b)) for a, b in z["bbox"])
+        shape = tuple(int(size) for size in z["shape"])
+        return z["packed"], bbox, int(z["voxel_count"]), shape
+
+
+def _unpack_volume(file_path: Path) -> npt.NDArray[np.uint8] | None:
+    """Rebuilds a 0/1 volume from a file written by `_save_packed`.
+
+    Args:
+        file_path (Path): The path of the `.npz` file.
+
+    Returns:
+        npt.NDArray[np.uint8] | None: The volume in (x, y, z) order, or None
+            if the file predates storing the volume shape.
+    """
+    with np.load(file_path) as z:
+        if "shape" not in z:
+            return None
+        shape = tuple(int(size) for size in z["shape"])
+        bbox = tuple(slice(int(a), int(b)) for a, b in z["bbox"])
+        packed = z["packed"]
+    volume = np.zeros(shape, dtype=np.uint8)
+    box_shape = volume[bbox].shape
+    volume[bbox] = np.unpackbits(packed, count=np.prod(box_shape)).reshape(
+        box_shape
+    )
+    return volume
+
+
+def _unpickle(file_path: Path) -> Any:
+    """Loads a pickle file read into memory with a single read.
+
+    Unpickling from an open file issues a read for every frame, which adds
+    up on network storage; the dataset pickles are small enough to buffer.
+
+    Args:
+        file_path (Path): The path to the pickle file.
+
+    Returns:
+        Any: The unpickled object.
+    """
+    return pickle.loads(file_path.read_bytes())
+
+
+def _save_dotprops(file_path: Path, dps: Any):
+    """Writes the arrays of a navis `Dotprops` to an `.npz` file.
+
+    Args:
+        file_path (Path): The path of the `.npz` file.
+        dps (Any): The navis `Dotprops` to store. It must have been built
+            with `k` nearest neighbours, or navis cannot compute its alpha
+            values.
+    """
+    np.savez(
+        file_path,
+        points=dps.points,
+        vect=dps.vect,
+        alpha=np.empty(0) if dps.alpha is None else dps.alpha,
+        k=int(dps.k),
+        units=str(dps.units),
+    )
+
+
+def _load_dotprops(file_path: Path) -> Any:
+    """Rebuilds a navis `Dotprops` from an `.npz` file.
+
+    Args:
+        file_path (Path): The path written by `_save_dotprops`.
+
+    Returns:
+        Any: The navis `Dotprops`.
+    """
+    with np.load(file_path) as z:
+        return navis.Dotprops(
+            points=z["points"],
+            k=int(z["k"]),
+            vect=z["vect"],
+            alpha=z["alpha"] if z["alpha"].size else None,
+            units=str(z["units"]),
+        )
+
+
+def _build_plot_skeleton(tract: Any) -> Any:
+    """Builds the skeleton of a hat bundle used for plotting tracts.
+
+    The dotprops are resampled, reduced to their two largest fragments and
+    skeletonized. `CACHE_VERSION` must be bumped when these steps change, as
+    their result is stored by `convert_dotprops_cache`.
+
+    Args:
+        tract (Any): The hat bundles dotprops or skeleton.
+
+    Returns:
+        Any: A navis `TreeNeuron` of the hat bundles.
+    """
+    tract = navis.make_dotprops(tract, k=100, resample=0.5)
+    tract = navis.drop_fluff(tract, n_largest=2)
+    return tract.to_skeleton(1)
+
+
+def _save_skeleton(file_path: Path, skeleton: Any):
+    """Writes the node table of a navis `TreeNeuron` to an `.npz` file.
+
+    Args:
+        file_path (Path): The path of the `.npz` file.
+        skeleton (Any): The navis `TreeNeuron` to store.
+    """
+    nodes = skeleton.nodes
+    np.savez(
+        file_path,
+        node_id=nodes["node_id"].to_numpy(),
+        parent_id=nodes["parent_id"].to_numpy(),
+        xyz=nodes[["x", "y", "z"]].to_numpy(),
+        radius=nodes["radius"].to_numpy(),
+        units=str(skeleton.units),
+    )
+
+
+def _load_skeleton(file_path: Path) -> Any:
+    """Rebuilds a navis `TreeNeuron` from an `.npz` file.
+
+    Args:
+        file_path (Path): The path written by `_save_skeleton`.
+
+    Returns:
+        Any: The navis `TreeNeuron`.
+    """
+    with np.load(file_path) as z:
+        xyz = z["xyz"]
+        nodes = pd.DataFrame(
+            {
+                "node_id": z["node_id"],
+                "parent_id": z["parent_id"],
+                "x": xyz[:, 0],
+                "y": xyz[:, 1],
+                "z": xyz[:, 2],
+                "radius": z["radius"],
+            }
+        )
+        return navis.TreeNeuron(nodes, units=str(z["units"]))
+
+
+def _is_up_to_date(cache_path: Path, source_path: Path) -> bool:
+    """Checks whether a cache file exists and is newer than its source.
+
+    Args:
+        cache_path (Path): The path to the derived cache file.
+        source_path (Path): The path to the file it was derived from.
+
+    Returns:
+        bool: True if the cache file can be used in place of the source.
+    """
+    return (
+        cache_path.exists()
+        and cache_path.stat().st_mtime >= source_path.stat().st_mtime
+    )
+
 
 if __name__ == "__main__":
     test_fafb_path = (
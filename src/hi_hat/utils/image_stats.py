@@ -0,0 +1,39 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, fall back to NumPy
+    njit = None
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _min_max_numba(values):
+        # one pass keeping both extremes
+        low = values[0]
+        high = values[0]
+        for i in range(1, values.size):
+            low = min(low, values[i])
+            high = max(high, values[i])
+        return low, high
+
+
+def min_max(image: np.ndarray) -> tuple:
+    """Finds the minimum and maximum value of an image.
+
+    Integer images are scanned once with a Numba kernel when numba is
+    installed. Other images, where NumPy's vectorized reductions are faster,
+    use `min` and `max`.
+
+    Args:
+        image (np.ndarray): A non-empty NumPy array.
+
+    Returns:
+        tuple: The minimum and the maximum value.
+    """
+    if njit is not None and image.dtype.kind in "iu":
+        # order="K" flattens C- and Fortran-ordered images without a copy,
+        # the element order does not matter for the extremes
+        return _min_max_numba(np.ravel(image, order="K"))
+    return image.min(), image.max()
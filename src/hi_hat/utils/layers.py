@@ -0,0 +1,46 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import napari
+
+
+def find_layer(
+    viewer: "napari.viewer.Viewer", name: str
+) -> "napari.layers.Layer | None":
+    """Looks up a viewer layer by name in a single pass over the layers.
+
+    This replaces the `name in viewer.layers` check followed by
+    `viewer.layers[name]`, which searches the layer list twice.
+
+    Args:
+        viewer (napari.viewer.Viewer): The napari viewer instance.
+        name (str): The name of the layer.
+
+    Returns:
+        napari.layers.Layer | None: The layer, or None if the viewer has no
+            layer with that name.
+    """
+    try:
+        return viewer.layers[name]
+    except KeyError:
+        return None
+
+
+def layers_in_viewer(
+    viewer: "napari.viewer.Viewer", layers
+) -> "list[napari.layers.Layer]":
+    """Filters layers down to those that are still in the viewer.
+
+    Membership is checked against a set of layer ids built in one pass, as
+    `layer in viewer.layers` scans the layer list for every layer.
+
+    Args:
+        viewer (napari.viewer.Viewer): The napari viewer instance.
+        layers (Iterable[napari.layers.Layer]): The layers to filter.
+
+    Returns:
+        list[napari.layers.Layer]: The layers still in the viewer, in their
+            given order.
+    """
+    present = {id(layer) for layer in viewer.layers}
+    return [layer for layer in layers if id(layer) in present]
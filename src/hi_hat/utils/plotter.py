@@ -1,15 +1,18 @@
+import os
+from collections.abc import Iterable
+from functools import partial
 from pathlib import Path
 
-import matplotlib.pyplot as plt
-import navis
+from .prefetch import prefetch
 
 
 def plot_tracts(
-    active_hemilineages: dict[str, str],
+    active_hemilineages: Iterable[tuple[str, str]],
     output_path: Path,
     loader: any,
     plot_symmetry: bool = False,
     progress_wrapper: any = None,
+    dpi: int = 400,
 ):
     """Plots hemilineage tracts and saves the figure to a file.
 
@@ -17,42 +20,54 @@ def plot_tracts(
     optionally including their symmetric counterparts, overlaid on a brain mesh.
 
     Args:
-        active_hemilineages (dict[str, str]): A dictionary where keys are
-            hemilineage names and values are their corresponding hex color codes.
+        active_hemilineages (Iterable[tuple[str, str]]): Pairs of hemilineage
+            names and their hex color codes. The pairs are consumed lazily, so
+            each skeleton is loaded as soon as its pair is produced.
         output_path (Path): The file path where the output plot image will be saved.
         loader (any): An instance of a data loader class that provides access
             to hemilineage data and brain meshes.
         plot_symmetry (bool, optional): If True, plots the symmetrized version
             of the tracts. Defaults to False.
         progress_wrapper (any, optional): A wrapper function (like tqdm) to
-            provide progress updates for the plotting process. Defaults to None.
+            provide progress updates for the plotting process. Without it,
+            each hemilineage is printed as it is plotted. Defaults to None.
+        dpi (int, optional): The resolution of raster output such as PNG.
+            Vector output such as PDF or SVG is not rasterized, so it is
+            faster to save at any resolution. Defaults to 400.
     """
-    iterable = active_hemilineages.items()
+    # imported here so loading the module does not pull in pyplot and navis
+    import matplotlib.pyplot as plt
+    import navis
+
+    # skeletons are built on worker threads, several ahead of the one being
+    # collected; navis and numpy release the GIL for most of this work
+    iterable = prefetch(
+        partial(_plot_skeleton, loader, plot_symmetry),
+        active_hemilineages,
+        depth=max(2, os.cpu_count() or 1),
+    )
     JRC2018U_mesh = loader.get_JRC2018U_mesh()
 
     print("----------- Plotting Tracts---------")
     print(f"Output path: {output_path}")
-    print("Active hemilineages to plot:")
-    for key, value in iterable:
-        print(f"- Name: {key}, Color: {value}")
-    print("------------------------------------")
 
     if progress_wrapper:
+        # the progress bar reports each hemilineage, so they are not printed
         iterable = progress_wrapper(iterable, desc="Plotting tracts:")
-    tract_nl = []
+    else:
+        print("Active hemilineages to plot:")
+    skeletons = []
     color_list = []
-    for hemilineage, color in iterable:
-        if plot_symmetry:
-            tract = loader._get_data(
-                hemilineage, "_hat_bundles_sym.pkl", "pkl"
-            )
-        else:
-            tract = loader._get_data(hemilineage, "_hat_bundles.pkl", "pkl")
-        tract = navis.make_dotprops(tract, k=100, resample=0.5)
-        tract = navis.drop_fluff(tract, n_largest=2)
-        tract_nl.append(tract.to_skeleton(1))
+    for (hemilineage, color), skeleton in iterable:
+        if not progress_wrapper:
+            print(f"- Name: {hemilineage}, Color: {color}")
+        skeletons.append(skeleton)
         color_list.append(color)
-    tract_nl = navis.NeuronList(tract_nl)
+    print("------------------------------------")
+    # the skeletons are built one per hemilineage rather than in one batched
+    # navis call, so each is cached by the loader and built while the next
+    # one loads; the list only holds references and is wrapped once here
+    tract_nl = navis.NeuronList(skeletons)
     fig, ax = navis.plot2d(
         [tract_nl, JRC2018U_mesh],
         color=color_list,
@@ -62,4 +77,27 @@ def plot_tracts(
         linewidth=0.2,
     )
     ax.axis("off")
-    plt.savefig(output_path, dpi=400, bbox_inches="tight")
+    save_kwargs = {}
+    if Path(output_path).suffix.lower() == ".png":
+        # the fastest zlib level; the default one spends about a third of
+        # the save time compressing for a ~10% smaller file
+        save_kwargs["pil_kwargs"] = {"compress_level": 1}
+    fig.savefig(output_path, dpi=dpi, bbox_inches="tight", **save_kwargs)
+    # pyplot keeps every figure alive until it is closed, including the
+    # collection holding a polygon per mesh face
+    plt.close(fig)
+
+
+def _plot_skeleton(loader: any, symmetry: bool, item: tuple[str, str]):
+    """Gets the skeleton of a hemilineage to plot.
+
+    Args:
+        loader (any): The data loader providing the skeletons.
+        symmetry (bool): If True, uses the symmetrized tracts.
+        item (tuple[str, str]): The hemilineage name and its color.
+
+    Returns:
+        Any: A navis `TreeNeuron` of the hat bundles.
+    """
+    hemilineage, _ = item
+    return loader.get_plot_skeleton(hemilineage, symmetry)
@@ -0,0 +1,39 @@
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+
+def prefetch(
+    load: Callable[[Any], Any], items: Iterable[Any], depth: int = 2
+) -> Iterator[tuple[Any, Any]]:
+    """Loads items in background threads ahead of their consumption.
+
+    While the caller works on one item, the next `depth` items are already
+    being loaded, which hides disk latency behind computation.
+
+    Args:
+        load (Callable[[Any], Any]): The function loading a single item.
+        items (Iterable[Any]): The items to load, in order.
+        depth (int): The number of items loaded ahead. Defaults to 2.
+
+    Yields:
+        tuple[Any, Any]: Each item with its loaded value, in input order.
+            Exceptions raised by `load` are re-raised here.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(load, item)))
+            if len(pending) >= depth:
+                break
+        while pending:
+            item, future = pending.popleft()
+            next_item = next(items, _END)
+            if next_item is not _END:
+                pending.append((next_item, executor.submit(load, next_item)))
+            yield item, future.result()
+
+
+_END = object()
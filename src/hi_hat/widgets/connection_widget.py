@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -5,6 +6,7 @@ from napari.utils import progress
 from napari.utils.notifications import show_error, show_info, show_warning
 from qtpy.QtCore import QSettings, Signal
 from qtpy.QtWidgets import (
+    QApplication,
     QFileDialog,
     QHBoxLayout,
     QLabel,
@@ -14,11 +16,12 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
-from ..utils.data_loaders import FAFB_loader
-
 if TYPE_CHECKING:
     pass
 
+# the kernel warm-up thread, started on the first connect of the process
+_warm_up_thread: threading.Thread | None = None
+
 
 class ConnectionWidget(QWidget):
     """A widget for connecting to the FAFB dataset.
@@ -42,6 +45,17 @@ class ConnectionWidget(QWidget):
         """
         super().__init__(parent)
         self.loader = None
+        # created once, each QSettings instance reloads the settings backend
+        self._settings = QSettings("hi-hat", "hat-viewer", self)
+        # Qt writes changed settings back from the event loop; this makes
+        # sure a path saved just before quitting reaches the disk
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self._settings.sync)
+        self._saved_path = ""
+        # built on the first browse and reused, so later browses keep the
+        # last directory and the file system already scanned
+        self._browse_dialog = None
         self.setLayout(QVBoxLayout())
         self.layout().setContentsMargins(0, 0, 0, 0)
 
@@ -66,16 +80,21 @@ class ConnectionWidget(QWidget):
 
     def _load_settings(self):
         """Loads the last used data path from application settings."""
-        settings = QSettings("hi-hat", "hat-viewer")
-        last_path = settings.value("data_path", "")
+        last_path = self._settings.value("data_path", "")
+        self._saved_path = last_path
         if last_path:
             self.path_edit.setText(last_path)
             self.status_label.setText("Status: Path loaded. Click connect.")
 
     def _save_settings(self):
-        """Saves the current data path to application settings."""
-        settings = QSettings("hi-hat", "hat-viewer")
-        settings.setValue("data_path", self.path_edit.text())
+        """Saves the current data path to application settings.
+
+        Nothing is written if the path is the one already saved.
+        """
+        path = self.path_edit.text()
+        if path != self._saved_path:
+            self._settings.setValue("data_path", path)
+            self._saved_path = path
 
     def _on_connect(self):
         """Handles the 'Connect' button click.
@@ -90,6 +109,10 @@ class ConnectionWidget(QWidget):
             return
 
         self.status_label.setText("Status: Connecting...")
+        # navis and numba are imported on connect, not on widget creation
+        from ..core.voxel_counting import warm_up_kernels
+        from ..utils.data_loaders import FAFB_loader
+
         try:
             self.loader = FAFB_loader(path)
             self.loader.validate_dataset(progress_wrapper=progress)
@@ -99,6 +122,14 @@ class ConnectionWidget(QWidget):
                 f"Status: Connected to {Path(path).name}"
             )
             self.connected.emit(self.loader)
+            # compile the overlap kernel while the user prepares a query; the
+            # compiled kernel is shared, so this only runs once per process
+            global _warm_up_thread
+            if _warm_up_thread is None:
+                _warm_up_thread = threading.Thread(
+                    target=warm_up_kernels, daemon=True
+                )
+                _warm_up_thread.start()
         except (FileNotFoundError, ValueError, NotADirectoryError) as e:
             show_error(f"Connection failed: {e}")
             self.loader = None
@@ -107,9 +138,16 @@ class ConnectionWidget(QWidget):
 
     def _on_browse(self):
         """Opens a file dialog to select the data directory."""
-        path = QFileDialog.getExistingDirectory(
-            self, "Select FAFB Dataset Directory"
-        )
-        if path:
-            self.path_edit.setText(path)
+        if self._browse_dialog is None:
+            self._browse_dialog = QFileDialog(
+                self, "Select FAFB Dataset Directory"
+            )
+            self._browse_dialog.setFileMode(QFileDialog.FileMode.Directory)
+            self._browse_dialog.setOption(
+                QFileDialog.Option.ShowDirsOnly, True
+            )
+            if self.path_edit.text():
+                self._browse_dialog.setDirectory(self.path_edit.text())
+        if self._browse_dialog.exec_():
+            self.path_edit.setText(self._browse_dialog.selectedFiles()[0])
             self._on_connect()
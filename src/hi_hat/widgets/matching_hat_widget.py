@@ -1,32 +1,36 @@
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import pandas as pd
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_error, show_info, show_warning
-from qtpy.QtCore import Qt
+from qtpy.QtCore import Qt, Signal
 from qtpy.QtWidgets import (
     QAbstractItemView,
     QCheckBox,
     QComboBox,
     QHBoxLayout,
     QHeaderView,
+    QPlainTextEdit,
     QPushButton,
     QTableWidget,
     QTableWidgetItem,
-    QTextEdit,
     QVBoxLayout,
     QWidget,
 )
 
-from ..core.hat_NBLAST import hat_nblast
-from ..core.voxel_counting import count_voxels_in_hemilineage
-from ..utils.colors import generate_random_hex_color
+from ..utils.colors import distinct_hex_colors
+from ..utils.layers import find_layer
 from .soma_detection_widget import SomaDetectionWidget
 
 if TYPE_CHECKING:
     import napari
 
+# the results column filled by each matching method, with its display name
+_SCORE_COLUMNS = {"voxel_score": "Voxel counting", "nblast_score": "NBLAST"}
+
 
 class MatchingHatWidget(QWidget):
     """A widget for matching query images with hemilineage templates.
@@ -44,8 +48,13 @@ class MatchingHatWidget(QWidget):
         results_path (str): The path to the CSV file where results are stored.
         last_matched_hemilineages (list[str]): A list of hemilineages from the
             most recent match operation.
+        matching (Signal): A Qt signal that emits True when a match starts
+            running in the background and False when it is done. The
+            binarized image must not be changed in between.
     """
 
+    matching = Signal(bool)
+
     def __init__(
         self,
         viewer: "napari.viewer.Viewer",
@@ -67,11 +76,21 @@ class MatchingHatWidget(QWidget):
         self.results_df = None
         self.results_path = None
         self.last_matched_hemilineages = []
+        # the loader's hemilineages, for constant-time checks of the input
+        self._hemilineage_set = frozenset()
+        # the color of each layer added by Update Display, so a layer that is
+        # removed and added again keeps its color
+        self._layer_colors = {}
+        # the worker scoring the current match, None when no match is running
+        self._match_worker = None
+        # set by reset(), the running match scores the previous query
+        self._match_discarded = False
 
         self.setLayout(QVBoxLayout())
 
         # --- UI Setup ---
-        self.hemilineage_input = QTextEdit()
+        # plain text, so names are never parsed as rich text
+        self.hemilineage_input = QPlainTextEdit()
         self.hemilineage_input.setPlaceholderText(
             "Enter hemilineage names, one per line..."
         )
@@ -133,6 +152,11 @@ class MatchingHatWidget(QWidget):
         """Resets the widget to its initial state for a new query."""
         self.hemilineage_input.clear()
         self.last_matched_hemilineages = []
+        self._layer_colors.clear()
+        # a running match scores the previous query, its results are dropped;
+        # Match stays disabled until it has finished, as its kernels cannot
+        # run next to a new match
+        self._match_discarded = self._match_worker is not None
         self.show_recent_only_checkbox.setChecked(False)
         if self.results_df is not None:
             self.results_df = None
@@ -140,15 +164,13 @@ class MatchingHatWidget(QWidget):
 
     def _update_enabled_state(self):
         """Enables or disables widget controls based on the current state."""
-        binarized_image_exists = "binarized_image" in self.viewer.layers
-        enabled = all(
-            [
-                self.loader is not None,
-                self.results_df is not None,
-                binarized_image_exists,
-            ]
+        # cheapest checks first; the layer list is only scanned if needed
+        enabled = (
+            self.loader is not None
+            and self.results_df is not None
+            and "binarized_image" in self.viewer.layers
         )
-        self.match_button.setEnabled(enabled)
+        self.match_button.setEnabled(enabled and self._match_worker is None)
         self.save_button.setEnabled(enabled)
         self.update_display_button.setEnabled(enabled)
         self.hemilineage_input.setEnabled(enabled)
@@ -167,6 +189,9 @@ class MatchingHatWidget(QWidget):
             loader_instance (FAFB_loader): The data loader to use.
         """
         self.loader = loader_instance
+        self._hemilineage_set = frozenset(
+            loader_instance.get_hemilineage_list() if loader_instance else ()
+        )
         self._update_enabled_state()
 
     def set_hemilineages(self, hemilineages):
@@ -175,7 +200,7 @@ class MatchingHatWidget(QWidget):
         Args:
             hemilineages (list[str]): A list of hemilineage names.
         """
-        self.hemilineage_input.setText("\n".join(hemilineages))
+        self.hemilineage_input.setPlainText("\n".join(hemilineages))
 
     def _on_display_toggle(self):
         """Handles toggling the display of recent results."""
@@ -188,18 +213,15 @@ class MatchingHatWidget(QWidget):
             show_warning("No results file available to save.")
             return
 
-        # Update the DataFrame from the table
+        # Collect the statuses from the table, then update the DataFrame in
+        # one assignment rather than one boolean mask per row
+        statuses = {}
         for row_idx in range(self.results_table.rowCount()):
             hemilineage_item = self.results_table.item(row_idx, 0)
-            if not hemilineage_item:
-                continue
-            hemilineage = hemilineage_item.text()
             status_combo = self.results_table.cellWidget(row_idx, 5)
-            if status_combo:
-                status = status_combo.currentText()
-                self.results_df.loc[
-                    self.results_df["Hemilineage"] == hemilineage, "status"
-                ] = status
+            if hemilineage_item and status_combo:
+                statuses[hemilineage_item.text()] = status_combo.currentText()
+        self._assign_by_hemilineage("status", statuses)
 
         try:
             self.results_df.to_csv(self.results_path, index=False)
@@ -209,6 +231,22 @@ class MatchingHatWidget(QWidget):
         except OSError as e:
             show_error(f"Failed to save results: {e}")
 
+    def _assign_by_hemilineage(self, column, values):
+        """Sets a results column for the given hemilineages in one assignment.
+
+        Args:
+            column (str): The column of the results DataFrame to set.
+            values (dict[str, Any]): The new value of each hemilineage; rows
+                of other hemilineages are left unchanged.
+        """
+        if not values:
+            return
+        hemilineages = self.results_df["Hemilineage"]
+        updated = hemilineages.isin(values.keys())
+        self.results_df.loc[updated, column] = hemilineages[updated].map(
+            values
+        )
+
     def _on_results_loaded(self, results_df, results_path):
         """Handles loading of results from a file.
 
@@ -255,6 +293,21 @@ class MatchingHatWidget(QWidget):
         hemilineages_to_process = [
             h.strip() for h in hemilineages_to_process if h.strip()
         ]
+        unknown = [
+            h
+            for h in hemilineages_to_process
+            if h not in self._hemilineage_set
+        ]
+        if unknown:
+            show_warning(
+                "Skipping hemilineages not in the dataset: "
+                + ", ".join(unknown)
+            )
+            hemilineages_to_process = [
+                h
+                for h in hemilineages_to_process
+                if h in self._hemilineage_set
+            ]
         if not hemilineages_to_process:
             show_info("No hemilineages specified to match.")
             return
@@ -263,18 +316,24 @@ class MatchingHatWidget(QWidget):
         print(f"last matched hemilineages: {self.last_matched_hemilineages}")
         self.show_recent_only_checkbox.setChecked(True)
         self._update_enabled_state()
-        # Filter for hemilineages that need matching
+        # Filter for hemilineages that need matching, looking up each one in
+        # a name -> (voxel, nblast, threshold) map of its first results row
+        first_rows = self.results_df.drop_duplicates("Hemilineage")
+        known = dict(
+            zip(
+                first_rows["Hemilineage"],
+                first_rows[
+                    ["voxel_score", "nblast_score", "threshold"]
+                ].itertuples(index=False, name=None),
+                strict=True,
+            )
+        )
         hemilineages_to_run = []
         for h in hemilineages_to_process:
-            row = self.results_df[self.results_df["Hemilineage"] == h]
-            if not row.empty:
-                has_score = (
-                    row["voxel_score"].iloc[0] != -1
-                    or row["nblast_score"].iloc[0] != -1
-                )
-                threshold_changed = (
-                    row["threshold"].iloc[0] != current_threshold
-                )
+            if h in known:
+                voxel_score, nblast_score, threshold = known[h]
+                has_score = voxel_score != -1 or nblast_score != -1
+                threshold_changed = threshold != current_threshold
                 if not has_score or threshold_changed:
                     hemilineages_to_run.append(h)
             else:
@@ -287,63 +346,100 @@ class MatchingHatWidget(QWidget):
             self._populate_table()
             return
 
-        # Run Voxel Counting
-        if self.voxel_checkbox.isChecked():
-            try:
-                voxel_scores = count_voxels_in_hemilineage(
-                    binarized_layer.data,
-                    hemilineages_to_run,
-                    self.loader,
-                    progress_wrapper=progress,
-                )
-                for h, score in voxel_scores.items():
-                    self.results_df.loc[
-                        self.results_df["Hemilineage"] == h, "voxel_score"
-                    ] = score
-            except KeyError as e:
-                show_error(f"Voxel counting failed: {e}")
-
-        # Run NBLAST
-        if self.nblast_checkbox.isChecked():
-            try:
-                query_image_path = query_layer.metadata.get("path")
-                if not query_image_path:
-                    show_warning("Query image path not found for NBLAST.")
-                else:
-                    nblast_scores = hat_nblast(
-                        query_image_path,
-                        hemilineages_to_run,
-                        current_threshold,
-                        self.loader,
-                        progress_wrapper=progress,
-                    )
-                    for h, score in nblast_scores.items():
-                        self.results_df.loc[
-                            self.results_df["Hemilineage"] == h, "nblast_score"
-                        ] = score
-            except KeyError as e:
-                show_error(f"NBLAST failed: {e}")
+        # scoring runs on a worker thread so the viewer stays responsive; the
+        # results are written back in _on_matched, on the main thread
+        worker = _run_matching(
+            binarized_layer.data,
+            query_layer.data,
+            current_threshold,
+            tuple(query_layer.scale),
+            hemilineages_to_run,
+            self.loader,
+            [
+                column
+                for column, checkbox in [
+                    ("voxel_score", self.voxel_checkbox),
+                    ("nblast_score", self.nblast_checkbox),
+                ]
+                if checkbox.isChecked()
+            ],
+            progress,
+            _connect={"errored": self._on_match_error},
+            _start_thread=False,
+        )
+        worker.returned.connect(
+            partial(
+                self._on_matched,
+                worker,
+                hemilineages_to_run,
+                current_threshold,
+                self.soma_detection_widget.manual_centroid,
+            )
+        )
+        worker.finished.connect(partial(self._on_match_finished, worker))
+        self._match_worker = worker
+        self._match_discarded = False
+        self._update_enabled_state()
+        self.matching.emit(True)
+        worker.start()
+
+    def _on_matched(self, worker, hemilineages, threshold, centroid, scores):
+        """Writes the scores of a finished match to the results.
+
+        Args:
+            worker (FunctionWorker): The worker that ran the match.
+            hemilineages (list[str]): The hemilineages that were matched.
+            threshold (float): The threshold of the binarized query image.
+            centroid (tuple[float, float, float]): The query centroid.
+            scores (dict[str, dict | KeyError]): The result of
+                `_run_matching`.
+        """
+        if worker is not self._match_worker or self._match_discarded:
+            return  # the widget was reset while matching
+        for column, result in scores.items():
+            if isinstance(result, KeyError):
+                show_error(f"{_SCORE_COLUMNS[column]} failed: {result}")
+            else:
+                self._assign_by_hemilineage(column, result)
 
         # Update metadata for all matched hemilineages
         time_stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for h in hemilineages_to_run:
-            self.results_df.loc[
-                self.results_df["Hemilineage"] == h, "query_centroid"
-            ] = str(self.soma_detection_widget.manual_centroid)
-            self.results_df.loc[
-                self.results_df["Hemilineage"] == h, "time_stamp"
-            ] = time_stamp
-            self.results_df.loc[
-                self.results_df["Hemilineage"] == h, "threshold"
-            ] = current_threshold
-
-        show_info(
-            f"Matching complete for {len(hemilineages_to_run)} hemilineages."
-        )
+        matched = self.results_df["Hemilineage"].isin(hemilineages)
+        self.results_df.loc[matched, "query_centroid"] = str(centroid)
+        self.results_df.loc[matched, "time_stamp"] = time_stamp
+        self.results_df.loc[matched, "threshold"] = threshold
+
+        show_info(f"Matching complete for {len(hemilineages)} hemilineages.")
         # save results once before populating table
         self._on_save()
         self._populate_table()
 
+    def _on_match_error(self, error):
+        """Reports an unexpected error raised while matching.
+
+        Args:
+            error (Exception): The exception raised by `_run_matching`.
+        """
+        show_error(f"Matching failed: {error}")
+
+    def _on_match_finished(self, worker):
+        """Re-enables matching once the match worker is done.
+
+        Args:
+            worker (FunctionWorker): The worker that ran the match.
+        """
+        if worker is self._match_worker:
+            self._forget_match_worker()
+
+    def _forget_match_worker(self):
+        """Stops tracking the running match, if any."""
+        if self._match_worker is None:
+            return
+        self._match_worker = None
+        self._match_discarded = False
+        self.matching.emit(False)
+        self._update_enabled_state()
+
     def _populate_table(self):
         """Fills the results table from the results DataFrame."""
         self.results_table.setSortingEnabled(False)
@@ -352,6 +448,15 @@ class MatchingHatWidget(QWidget):
         if self.results_df is None:
             return
 
+        # repaint once when the table is complete rather than per cell
+        self.results_table.setUpdatesEnabled(False)
+        try:
+            self._fill_table()
+        finally:
+            self.results_table.setUpdatesEnabled(True)
+
+    def _fill_table(self):
+        """Adds a row to the empty results table per displayed result."""
         if (
             self.show_recent_only_checkbox.isChecked()
             and self.last_matched_hemilineages
@@ -369,12 +474,21 @@ class MatchingHatWidget(QWidget):
 
         self.results_table.setRowCount(len(df_to_display))
 
-        for row_idx, row_data in df_to_display.iterrows():
-            name = row_data["Hemilineage"]
+        # the checkbox cells only differ in position, so they are cloned
+        check_template = QTableWidgetItem()
+        check_template.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+        check_template.setCheckState(Qt.Unchecked)
+
+        # plain tuples avoid building a pd.Series for every row
+        rows = df_to_display.reindex(
+            columns=["Hemilineage", "voxel_score", "nblast_score", "status"],
+            fill_value="not_reviewed",
+        ).itertuples(index=False, name=None)
+        for row_idx, row in enumerate(rows):
+            name, voxel_score, nblast_score, current_status = row
             self.results_table.setItem(row_idx, 0, QTableWidgetItem(name))
 
             # Voxel Score
-            voxel_score = row_data["voxel_score"]
             if pd.notna(voxel_score) and voxel_score != -1:
                 voxel_item = QTableWidgetItem(f"{voxel_score:.4f}")
                 voxel_item.setData(Qt.UserRole, voxel_score)
@@ -383,7 +497,6 @@ class MatchingHatWidget(QWidget):
             self.results_table.setItem(row_idx, 1, voxel_item)
 
             # NBLAST Score
-            nblast_score = row_data["nblast_score"]
             if pd.notna(nblast_score) and nblast_score != -1:
                 nblast_item = QTableWidgetItem(f"{nblast_score:.4f}")
                 nblast_item.setData(Qt.UserRole, nblast_score)
@@ -391,24 +504,15 @@ class MatchingHatWidget(QWidget):
                 nblast_item = QTableWidgetItem("")
             self.results_table.setItem(row_idx, 2, nblast_item)
 
-            # Tract Checkbox
-            tract_check = QTableWidgetItem()
-            tract_check.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-            tract_check.setCheckState(Qt.Unchecked)
-            self.results_table.setItem(row_idx, 3, tract_check)
-
-            # Neuron Checkbox
-            neuron_check = QTableWidgetItem()
-            neuron_check.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-            neuron_check.setCheckState(Qt.Unchecked)
-            self.results_table.setItem(row_idx, 4, neuron_check)
+            # Tract and Neuron Checkboxes
+            self.results_table.setItem(row_idx, 3, check_template.clone())
+            self.results_table.setItem(row_idx, 4, check_template.clone())
 
             # Status Dropdown
             status_combo = QComboBox()
             status_combo.addItems(
                 ["unsure", "accept", "reject", "not_reviewed"]
             )
-            current_status = row_data.get("status", "not_reviewed")
             status_combo.setCurrentText(current_status)
             self.results_table.setCellWidget(row_idx, 5, status_combo)
 
@@ -446,38 +550,102 @@ class MatchingHatWidget(QWidget):
             show_info("No hemilineages selected for display.")
             return
 
+        # dataset volumes never change, so layers already in the viewer are
+        # kept as they are rather than reloaded and replaced
+        layers_to_add = []
         for name, load_tract, load_neuron in selected_hemilineages:
-            if load_tract:
-                tracts = self.loader.get_hat_bundles_nrrd(name)
-                layer_name = f"{name}_tract"
-                layer_kwargs = {
-                    "name": layer_name,
-                    "axis_labels": ("x", "y", "z"),
-                    "blending": "additive",
-                    "contrast_limits": [0, 1],
-                    "colormap": generate_random_hex_color(),
-                    "scale": (0.38, 0.38, 0.38),
-                    "units": ("micron", "micron", "micron"),
-                    "metadata": {"hemilineage": name},
-                }
-                if layer_kwargs["name"] in self.viewer.layers:
-                    self.viewer.layers[layer_kwargs["name"]].data = tracts
-                else:
-                    self.viewer.add_image(tracts, **layer_kwargs)
-            if load_neuron:
-                neurons = self.loader.get_whole_neuron_nrrd(name)
-                layer_name = f"{name}_neurons"
-                layer_kwargs = {
-                    "name": layer_name,
-                    "axis_labels": ("x", "y", "z"),
-                    "blending": "additive",
-                    "contrast_limits": [0, 1],
-                    "colormap": generate_random_hex_color(),
-                    "scale": (0.38, 0.38, 0.38),
-                    "units": ("micron", "micron", "micron"),
-                    "metadata": {"hemilineage": name},
-                }
-                if layer_kwargs["name"] in self.viewer.layers:
-                    self.viewer.layers[layer_kwargs["name"]].data = neurons
-                else:
-                    self.viewer.add_image(neurons, **layer_kwargs)
+            if load_tract and find_layer(self.viewer, f"{name}_tract") is None:
+                layers_to_add.append(
+                    (name, "tract", self.loader.get_hat_bundles_nrrd)
+                )
+            if (
+                load_neuron
+                and find_layer(self.viewer, f"{name}_neurons") is None
+            ):
+                layers_to_add.append(
+                    (name, "neurons", self.loader.get_whole_neuron_nrrd)
+                )
+        if not layers_to_add:
+            show_info("The selected layers are already displayed.")
+            return
+
+        # layers shown for the first time take the next palette colors
+        new_names = [
+            f"{name}_{kind}"
+            for name, kind, _ in layers_to_add
+            if f"{name}_{kind}" not in self._layer_colors
+        ]
+        self._layer_colors.update(
+            zip(
+                new_names,
+                distinct_hex_colors(len(new_names), len(self._layer_colors)),
+                strict=True,
+            )
+        )
+        for name, kind, load in layers_to_add:
+            layer_name = f"{name}_{kind}"
+            layer_kwargs = {
+                "name": layer_name,
+                "axis_labels": ("x", "y", "z"),
+                "blending": "additive",
+                "contrast_limits": [0, 1],
+                "colormap": self._layer_colors[layer_name],
+                "scale": (0.38, 0.38, 0.38),
+                "units": ("micron", "micron", "micron"),
+                "metadata": {"hemilineage": name},
+            }
+            self.viewer.add_image(load(name), **layer_kwargs)
+
+
+@thread_worker
+def _run_matching(
+    query_voxels,
+    query_image,
+    threshold,
+    voxel_size,
+    hemilineages,
+    loader,
+    columns,
+    progress,
+):
+    """Scores hemilineages against a binarized query on a worker thread.
+
+    Args:
+        query_voxels (np.ndarray): The binarized query image.
+        query_image (np.ndarray): The raw query image, from which NBLAST
+            builds the query dotprops.
+        threshold (float): The threshold of the binarized query image.
+        voxel_size (tuple[float, ...]): The scale of the query image layer,
+            in microns.
+        hemilineages (list[str]): The hemilineages to score.
+        loader (FAFB_loader): The data loader.
+        columns (list[str]): The score columns to compute, 'voxel_score'
+            and/or 'nblast_score'.
+        progress (callable): A progress reporting callable, e.g., from
+            napari.
+
+    Returns:
+        dict[str, dict | KeyError]: For each column, the score of each
+            hemilineage, or the `KeyError` raised while computing them.
+    """
+    # navis and numba are imported on the first match
+    from ..core.hat_NBLAST import hat_nblast
+    from ..core.query import QueryBundle
+    from ..core.voxel_counting import count_voxels_in_hemilineage
+
+    methods = {
+        "voxel_score": count_voxels_in_hemilineage,
+        "nblast_score": hat_nblast,
+    }
+    # the query is shared by both methods, so its dotprops are only built
+    # once per match
+    query = QueryBundle(query_voxels, voxel_size, query_image, threshold)
+    scores = {}
+    for column in columns:
+        try:
+            scores[column] = methods[column](
+                query, hemilineages, loader, progress_wrapper=progress
+            )
+        except KeyError as e:
+            scores[column] = e
+    return scores
@@ -1,3 +1,5 @@
+import io
+from functools import lru_cache
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -162,7 +164,7 @@ class ResultsLoaderWidget(QWidget):
         final_df = None
         if path and path.exists():
             try:
-                df_from_file = pd.read_csv(path)
+                df_from_file = _read_results_csv(path)
                 print(
                     f"Results loader: Loaded {len(df_from_file)} rows from {path}"
                 )
@@ -329,3 +331,37 @@ class ResultsLoaderWidget(QWidget):
             str: The path to the current results file.
         """
         return self.results_path
+
+
+def _read_results_csv(path: Path) -> pd.DataFrame:
+    """Reads a results CSV, reusing the parsed table while it is unchanged.
+
+    Every widget holding a results loader reads the same file on its initial
+    load, so the parsed table is cached by the file content. The file is
+    small, so reading it to compare is cheap next to parsing it; unlike its
+    size and modification time, the content always changes with an edit.
+
+    Args:
+        path (Path): The path to the CSV file.
+
+    Returns:
+        pd.DataFrame: A copy of the parsed table that the caller may modify.
+
+    Raises:
+        OSError: If the file cannot be read.
+        pd.errors.ParserError: If the file is not a valid CSV.
+    """
+    return _parse_csv_cached(path.read_bytes()).copy()
+
+
+@lru_cache(maxsize=8)
+def _parse_csv_cached(content: bytes) -> pd.DataFrame:
+    """Parses the content of a CSV file.
+
+    Args:
+        content (bytes): The raw content of the CSV file.
+
+    Returns:
+        pd.DataFrame: The parsed table, which must not be modified.
+    """
+    return pd.read_csv(io.BytesIO(content))
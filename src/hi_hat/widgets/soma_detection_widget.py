@@ -1,5 +1,8 @@
 from typing import TYPE_CHECKING
 
+import numpy as np
+import pandas as pd
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_error, show_info, show_warning
 from qtpy.QtCore import Signal
 from qtpy.QtWidgets import (
@@ -10,11 +13,51 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
-from ..core.cellbody_matching import _JRC2018U_mirror, centroid_matching
+from ..core.cellbody_matching import (
+    _JRC2018U_mirror,
+    _JRC2018U_mirror_inplace,
+    centroid_matching,
+)
+from ..utils.layers import find_layer
 
 if TYPE_CHECKING:
     import napari
 
+# a stored "(z, y, x)" centroid string
+_CENTROID_PATTERN = (
+    r"^\s*\(?\s*([^,\s]+)\s*,\s*([^,\s]+)\s*,\s*([^,\s)]+)\s*\)?\s*$"
+)
+
+
+def _parse_point_indices(indices_str):
+    """Parses a user selection string into zero-based point indices.
+
+    Args:
+        indices_str (str): One-based indices and inclusive ranges separated by
+            commas, e.g. "1,2,3" or "1-5".
+
+    Returns:
+        np.ndarray: The zero-based index of each selected point.
+
+    Raises:
+        ValueError: If a part of the string is not an integer or a range, or
+            a range ends before it starts.
+    """
+    ranges = []
+    for part in indices_str.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = map(int, part.split("-"))
+            if end < start:
+                # np.arange would silently select nothing
+                raise ValueError(f"range '{part}' ends before it starts")
+            ranges.append(np.arange(start - 1, end, dtype=np.int64))
+        elif part:
+            ranges.append(np.array([int(part) - 1], dtype=np.int64))
+    if not ranges:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(ranges)
+
 
 class SomaDetectionWidget(QWidget):
     """A widget for soma detection and centroid calculation.
@@ -37,6 +80,9 @@ class SomaDetectionWidget(QWidget):
 
     matched = Signal(list)
 
+    # style of the index labels drawn next to the selected points
+    _LABEL_STYLE = {"size": 7, "color": "red"}
+
     def __init__(self, viewer: "napari.viewer.Viewer", parent=None):
         """Initializes the SomaDetectionWidget.
 
@@ -50,6 +96,10 @@ class SomaDetectionWidget(QWidget):
         self.results_df = None
         self.manual_centroid = None
         self.last_matched_hemilineages = None
+        # "1".."N" labels of the selected points, grown incrementally
+        self._labels = []
+        # the running centroid matching, if any
+        self._match_worker = None
 
         self.setLayout(QVBoxLayout())
 
@@ -63,8 +113,9 @@ class SomaDetectionWidget(QWidget):
         )
         self.layout().addWidget(self.info_label)
 
+        # the size also applies to points added later, so it is set once
         self.points_layer = self.viewer.add_points(
-            name="Selected Points", ndim=3
+            name="Selected Points", ndim=3, size=5
         )
         self.points_layer.events.data.connect(self._on_points_added)
 
@@ -79,15 +130,19 @@ class SomaDetectionWidget(QWidget):
 
     def reset(self):
         """Resets the widget to its initial state for a new query."""
-        if "Selected Points" in self.viewer.layers:
-            self.viewer.layers["Selected Points"].data = []
-        if "LM_centroid" in self.viewer.layers:
-            self.viewer.layers["LM_centroid"].data = []
-        if "Selected Points" not in self.viewer.layers:
+        points_layer = find_layer(self.viewer, "Selected Points")
+        if points_layer is not None:
+            points_layer.data = []
+        else:
             self.points_layer = self.viewer.add_points(
-                name="Selected Points", ndim=3
+                name="Selected Points", ndim=3, size=5
             )
-        if "LM_centroid" not in self.viewer.layers:
+            self.points_layer.events.data.connect(self._on_points_added)
+            self._labels = []
+        centroid_layer = find_layer(self.viewer, "LM_centroid")
+        if centroid_layer is not None:
+            centroid_layer.data = []
+        else:
             self.viewer.add_points(
                 name="LM_centroid", size=15, face_color="red", ndim=3
             )
@@ -99,15 +154,14 @@ class SomaDetectionWidget(QWidget):
 
     def _update_enabled_state(self):
         """Enables or disables widget controls based on the current state."""
-        binarized_image_exists = "binarized_image" in self.viewer.layers
-        enabled = all(
-            [
-                self.loader is not None,
-                self.results_df is not None,
-                binarized_image_exists,
-            ]
+        # cheapest checks first; the layer list is only scanned if needed
+        enabled = (
+            self.loader is not None
+            and self.results_df is not None
+            and "binarized_image" in self.viewer.layers
         )
-        self.centroid_btn.setEnabled(enabled)
+        # no new matching while one is still running
+        self.centroid_btn.setEnabled(enabled and self._match_worker is None)
         if not enabled:
             self.info_label.setText(
                 "Connect to data, load results, and create a binarized image to enable."
@@ -132,24 +186,26 @@ class SomaDetectionWidget(QWidget):
         self.results_df = df
         self._update_enabled_state()
         if df is not None and "query_centroid" in df.columns:
-            centroids = []
-            for _, row in df.iterrows():
-                centroid_str = row["query_centroid"]
-                if isinstance(centroid_str, str):
-                    try:
-                        # Assuming format "(z, y, x)"
-                        coords = [
-                            float(c.strip())
-                            for c in centroid_str.strip("()").split(",")
-                        ]
-                        mirror_coords = _JRC2018U_mirror(coords[::-1])[::-1]
-                        centroids.extend([coords, mirror_coords])
-                    except (ValueError, IndexError):
-                        continue  # Skip malformed entries
-
-            if centroids:
-                if "LM_centroid" in self.viewer.layers:
-                    self.viewer.layers["LM_centroid"].data = centroids
+            # parse all "(z, y, x)" strings at once, skipping malformed ones
+            coords = (
+                df["query_centroid"]
+                .dropna()
+                .astype(str)
+                .str.extract(_CENTROID_PATTERN)
+                .apply(pd.to_numeric, errors="coerce")
+                .dropna()
+                .to_numpy(dtype=float)
+            )
+            # each centroid is followed by its mirror image
+            centroids = np.empty((2 * len(coords), 3))
+            centroids[0::2] = coords
+            centroids[1::2] = coords
+            _JRC2018U_mirror_inplace(centroids[1::2], axis=-1)
+
+            if len(centroids):
+                centroid_layer = find_layer(self.viewer, "LM_centroid")
+                if centroid_layer is not None:
+                    centroid_layer.data = centroids
                 else:
                     self.viewer.add_points(
                         centroids,
@@ -173,27 +229,36 @@ class SomaDetectionWidget(QWidget):
         Args:
             event (napari.utils.events.Event): The data change event.
         """
-        coords = self.points_layer.data
-        labels = [str(i + 1) for i in range(len(coords))]
-        self.points_layer.text = {"string": labels, "size": 7, "color": "red"}
-        self.points_layer.size = 5
+        n_points = len(self.points_layer.data)
+        if n_points == len(self._labels):
+            return  # points were only moved, the labels still apply
+        if n_points > len(self._labels):
+            self._labels.extend(
+                str(i + 1) for i in range(len(self._labels), n_points)
+            )
+        else:
+            del self._labels[n_points:]
+        self.points_layer.text = {"string": self._labels, **self._LABEL_STYLE}
 
     def _calculate_centroid(self, indices):
         """Calculates the centroid for a given set of point indices.
 
         Args:
-            indices (list[int]): A list of integer indices corresponding to
-                the points in the 'Selected Points' layer.
+            indices (np.ndarray | None): An integer array of indices
+                corresponding to the points in the 'Selected Points' layer,
+                or None to use every point.
 
         Returns:
             tuple[float, float, float] | None: The (z, y, x) coordinates of
                 the centroid, or None if no valid points are found.
         """
         coords = self.points_layer.data
-        if len(coords) == 0 or not indices:
+        if len(coords) == 0 or (indices is not None and len(indices) == 0):
             return None
-        selected_coords = coords[indices]
-        return tuple(float(c) for c in selected_coords.mean(axis=0))
+        if indices is not None:
+            coords = coords.take(indices, axis=0)
+        # tolist converts all coordinates to Python floats in one call
+        return tuple(coords.mean(axis=0).tolist())
 
     def _get_cluster_centroid(self):
         """Gets point indices from the user, calculates the centroid, and runs matching."""
@@ -216,18 +281,11 @@ class SomaDetectionWidget(QWidget):
             return
 
         try:
-            indices = []
             # If user enters "All" or leaves it blank, use all points
             if not indices_str.strip() or indices_str.strip().lower() == "all":
-                indices = list(range(len(self.points_layer.data)))
+                indices = None
             else:
-                for part in indices_str.split(","):
-                    part = part.strip()
-                    if "-" in part:
-                        start, end = map(int, part.split("-"))
-                        indices.extend(range(start - 1, end))
-                    elif part:
-                        indices.append(int(part) - 1)
+                indices = _parse_point_indices(indices_str)
 
             centroid_tuple = self._calculate_centroid(indices)
             if centroid_tuple is None:
@@ -241,17 +299,51 @@ class SomaDetectionWidget(QWidget):
             self.points_layer.data = []
 
             user_centroid = centroid_tuple[::-1]  # Reverse for matching
-            result = centroid_matching(user_centroid, self.loader)
-            self.last_matched_hemilineages = result["hemilineages"]
-            self.matched.emit(self.last_matched_hemilineages)
-            print(f"Matched hemilineages: {result['hemilineages']}")
-            show_info(f"Matched hemilineages: {result['hemilineages']}")
+            # match on a worker thread so the viewer stays responsive
+            worker = _match_centroid(
+                user_centroid,
+                self.loader,
+                _connect={
+                    "returned": self._on_centroid_matched,
+                    "errored": self._on_centroid_match_error,
+                    "finished": self._on_centroid_match_finished,
+                },
+                _start_thread=False,
+            )
+            self._match_worker = worker
+            self.centroid_btn.setEnabled(False)
+            self.info_label.setText("Matching centroid...")
+            worker.start()
 
         except (ValueError, IndexError) as e:
             show_error(f"Invalid input: {e}")
         # except Exception as e:
         #     show_error(f"An error occurred: {e}")
 
+    def _on_centroid_matched(self, result):
+        """Reports the hemilineages matched to the centroid.
+
+        Args:
+            result (dict): The result of `centroid_matching`.
+        """
+        self.last_matched_hemilineages = result["hemilineages"]
+        self.matched.emit(self.last_matched_hemilineages)
+        print(f"Matched hemilineages: {result['hemilineages']}")
+        show_info(f"Matched hemilineages: {result['hemilineages']}")
+
+    def _on_centroid_match_error(self, error):
+        """Reports an error raised while matching the centroid.
+
+        Args:
+            error (Exception): The exception raised by the worker.
+        """
+        show_error(f"Centroid matching failed: {error}")
+
+    def _on_centroid_match_finished(self):
+        """Re-enables matching once the worker has finished."""
+        self._match_worker = None
+        self._update_enabled_state()
+
     def _update_viewer_with_centroid(self, centroid):
         """Adds or updates the centroid point layer in the viewer.
 
@@ -260,11 +352,12 @@ class SomaDetectionWidget(QWidget):
         Args:
             centroid (tuple): The (z, y, x) coordinates of the centroid.
         """
-        mirrored_centroid = _JRC2018U_mirror(centroid[::-1])[::-1]
+        mirrored_centroid = _JRC2018U_mirror(centroid, axis=-1)
         points_to_add = [centroid, mirrored_centroid]
 
-        if "LM_centroid" in self.viewer.layers:
-            self.viewer.layers["LM_centroid"].add(points_to_add)
+        centroid_layer = find_layer(self.viewer, "LM_centroid")
+        if centroid_layer is not None:
+            centroid_layer.add(points_to_add)
         else:
             self.viewer.add_points(
                 points_to_add,
@@ -272,3 +365,17 @@ class SomaDetectionWidget(QWidget):
                 size=15,
                 face_color="yellow",
             )
+
+
+@thread_worker
+def _match_centroid(user_centroid, loader):
+    """Runs `centroid_matching` on a worker thread.
+
+    Args:
+        user_centroid (tuple): The (x, y, z) coordinates of the centroid.
+        loader (FAFB_loader): The data loader providing the somas.
+
+    Returns:
+        dict: The result of `centroid_matching`.
+    """
+    return centroid_matching(user_centroid, loader)
@@ -1,7 +1,9 @@
-from typing import TYPE_CHECKING
+import math
+from typing import TYPE_CHECKING, Any
 
+import numpy as np
 from napari.utils.notifications import show_error, show_info, show_warning
-from qtpy.QtCore import Qt
+from qtpy.QtCore import QSignalBlocker, Qt
 from qtpy.QtWidgets import (
     QHBoxLayout,
     QLabel,
@@ -12,10 +14,36 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
+from ..utils.image_stats import min_max
+from ..utils.layers import find_layer
+
 if TYPE_CHECKING:
     import napari
 
 
+def _comparison_threshold(dtype: np.dtype, threshold: float) -> Any:
+    """Converts a threshold to a scalar of the image dtype where possible.
+
+    For integer images, `x > t` holds exactly when `x > floor(t)`, and
+    comparing in the image dtype avoids casting every voxel to float64.
+
+    Args:
+        dtype (np.dtype): The dtype of the image.
+        threshold (float): The threshold value.
+
+    Returns:
+        Any: The threshold as a scalar of `dtype`, or unchanged if the image
+            is not an integer image or the threshold is outside its range.
+    """
+    if dtype.kind not in "iu" or not math.isfinite(threshold):
+        return threshold
+    value = math.floor(threshold)
+    info = np.iinfo(dtype)
+    if not info.min <= value < info.max:
+        return threshold
+    return dtype.type(value)
+
+
 class ThresholdWidget(QWidget):
     """A widget for image thresholding."""
 
@@ -23,6 +51,8 @@ class ThresholdWidget(QWidget):
         super().__init__(parent)
         self.viewer = viewer
         self.is_initialized = False
+        # reused for every threshold so the slider does not reallocate
+        self._binarized = None
         self.setLayout(QVBoxLayout())
 
         # --- UI Setup ---
@@ -52,6 +82,7 @@ class ThresholdWidget(QWidget):
         # Disconnect signals to avoid issues on reset
         try:
             self.threshold_slider.valueChanged.disconnect()
+            self.threshold_slider.sliderReleased.disconnect()
             self.threshold_box.textChanged.disconnect()
         except (TypeError, RuntimeError):
             # In case they were never connected or already disconnected
@@ -62,6 +93,7 @@ class ThresholdWidget(QWidget):
         self.threshold_box.setEnabled(False)
         self.threshold_slider.setEnabled(False)
         self.is_initialized = False
+        self._binarized = None
 
     def _initialize_threshold(self):
         """
@@ -72,20 +104,20 @@ class ThresholdWidget(QWidget):
             query_layer = self.viewer.layers["query_image"]
             from skimage.filters import threshold_otsu
 
-            threshold_value = threshold_otsu(query_layer.data)
+            # Otsu on a uniform 1/32 sample (whole rows skipped on the outer
+            # axes) approximates the full-volume threshold closely, but may
+            # differ from it slightly
+            threshold_value = threshold_otsu(query_layer.data[::2, ::4, ::4])
 
-            data_min, data_max = query_layer.data.min(), query_layer.data.max()
+            data_min, data_max = min_max(query_layer.data)
             self.threshold_slider.setRange(int(data_min), int(data_max))
             self.threshold_slider.setValue(int(threshold_value))
             self.threshold_box.setText(str(threshold_value))
 
             # Connect signals now that we are initialized
-            self.threshold_slider.valueChanged.connect(
-                lambda v: self.threshold_box.setText(str(v))
-            )
-            self.threshold_box.textChanged.connect(
-                lambda t: self.threshold_slider.setValue(int(float(t.strip())))
-            )
+            self.threshold_slider.valueChanged.connect(self._on_slider_changed)
+            self.threshold_box.textChanged.connect(self._on_text_changed)
+            self.threshold_slider.sliderReleased.connect(self._on_threshold)
 
             # Enable controls
             self.threshold_box.setEnabled(True)
@@ -107,6 +139,31 @@ class ThresholdWidget(QWidget):
             # In our new flow, this is less likely but good to keep.
             return False
 
+    def _on_slider_changed(self, value):
+        """Shows the slider value in the text box.
+
+        Args:
+            value (int): The new slider value.
+        """
+        # blocked so the text box does not set the slider value back
+        with QSignalBlocker(self.threshold_box):
+            self.threshold_box.setText(str(value))
+
+    def _on_text_changed(self, text):
+        """Moves the slider to the value typed in the text box.
+
+        Args:
+            text (str): The new text of the text box.
+        """
+        try:
+            value = int(float(text.strip()))
+        except ValueError:
+            return  # incomplete input, e.g. while the box is being cleared
+        # blocked so the slider does not overwrite the typed text, e.g. a
+        # fractional threshold with its integer part
+        with QSignalBlocker(self.threshold_slider):
+            self.threshold_slider.setValue(value)
+
     def _on_threshold(self):
         """
         Initialize the widget if needed, then apply the threshold.
@@ -117,8 +174,14 @@ class ThresholdWidget(QWidget):
         # If we reach here, the widget is initialized.
         try:
             threshold_value = float(self.threshold_box.text())
-            query_layer = self.viewer.layers["query_image"]
-            binarized_data = query_layer.data > threshold_value
+            data = self.viewer.layers["query_image"].data
+            if self._binarized is None or self._binarized.shape != data.shape:
+                self._binarized = np.empty(data.shape, dtype=bool)
+            binarized_data = np.greater(
+                data,
+                _comparison_threshold(data.dtype, threshold_value),
+                out=self._binarized,
+            )
 
             add_kwargs = {
                 "name": "binarized_image",
@@ -128,11 +191,10 @@ class ThresholdWidget(QWidget):
                 "units": ("micron", "micron", "micron"),
                 "metadata": {"threshold": threshold_value},
             }
-            if add_kwargs["name"] in self.viewer.layers:
-                self.viewer.layers[add_kwargs["name"]].data = binarized_data
-                self.viewer.layers[add_kwargs["name"]].metadata[
-                    "threshold"
-                ] = threshold_value
+            binarized_layer = find_layer(self.viewer, add_kwargs["name"])
+            if binarized_layer is not None:
+                binarized_layer.data = binarized_data
+                binarized_layer.metadata["threshold"] = threshold_value
             else:
                 self.viewer.add_image(
                     binarized_data, **add_kwargs, colormap="magenta"